@@ -0,0 +1,63 @@
+import asyncio
+import inspect
+
+
+class GuildWriters:
+    """
+    One write queue per guild, each drained by its own worker task.
+
+    Functions submitted for a guild run one at a time in submission order, so a read-modify-write can't interleave
+    with another write of the same guild. Different guilds have different workers and proceed independently.
+    A worker stops after `idle_timeout` seconds without work and is recreated on the next submission.
+    """
+
+    def __init__(self, idle_timeout: float = 60.0) -> None:
+        self.idle_timeout = idle_timeout
+        self.queues: dict[int, asyncio.Queue] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+
+    async def submit(self, server_id: int, function, *args):
+        """Runs `function(*args)` (a function or a coroutine function) in the guild's queue and returns its result."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues.get(server_id)
+        if queue is None:
+            queue = self.queues[server_id] = asyncio.Queue()
+            self.workers[server_id] = asyncio.create_task(self._work(server_id, queue))
+        queue.put_nowait((future, function, args))
+        return await future
+
+    async def _work(self, server_id: int, queue: asyncio.Queue) -> None:
+        while True:
+            try:
+                future, function, args = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    self.queues.pop(server_id, None)
+                    self.workers.pop(server_id, None)
+                    return
+                continue
+
+            try:
+                result = function(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                queue.task_done()
+
+    async def join(self) -> None:
+        """Waits until every queued write has run."""
+        await asyncio.gather(*(queue.join() for queue in list(self.queues.values())))
+
+    async def close(self) -> None:
+        for worker in self.workers.values():
+            worker.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
+        self.queues.clear()
+        self.workers.clear()
+
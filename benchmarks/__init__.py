@@ -0,0 +1,5 @@
+"""
+Offline benchmarks. They run without a Discord connection, from the repository's root:
+
+    python -m benchmarks.parser_bench --help
+"""
@@ -0,0 +1,118 @@
+import json
+import random
+
+from suggestion_lexer import keywords
+
+# Field of a stored suggestion -> keyword token that produces it
+FIELD_TOKENS = {
+    'title': 'TITLE', 'author': 'AUTHOR', 'genre': 'GENRE', 'description': 'DESCRIPTION', 'date': 'DATE',
+    'notes': 'NOTES', 'reviews': 'REVIEWS', 'goodreads': 'GOODREADS', 'wikipedia': 'WIKIPEDIA', 'links': 'LINKS',
+    'pages': 'PAGES', 'download': 'DOWNLOAD', 'downloads': 'DOWNLOAD', 'quotes': 'QUOTES',
+}
+
+# How members write the header of a field, e.g. '> **Title**: ...'
+HEADER_FORMATS = ('{alias}: ', '> {alias}: ', '**{alias}:** ', '> **{alias}**: ', '- {alias}: ', '__{alias}__ : ')
+
+CHAT_WORDS = (
+    'hey', 'anyone', 'read', 'this', 'book', 'yet', 'lol', 'i', 'think', 'the', 'ending', 'was', 'great', 'not',
+    'sure', 'about', 'next', 'month', 'vote', 'for', 'me', 'haha', 'same', 'really', 'liked', 'chapter', 'author',
+    'title', 'de', 'que', 'livro', 'gostei', 'muito', 'também', ':)', '📚', '<@348800725272363009>',
+    'https://www.goodreads.com/book/show/6149', 'note:', 'ok:',
+)
+
+ADVERSARIAL_KINDS = ('long_line', 'colon_storm', 'decorations', 'many_fields', 'no_newlines', 'near_headers')
+
+
+def load_suggestions(db_path: str) -> list[dict]:
+    """Every suggestion stored in a TinyDB database file, without its id."""
+    with open(db_path, encoding='utf-8') as file:
+        tables = json.load(file)
+    suggestions = []
+    for server in tables.get('_default', {}).values():
+        for users in server.get('months', {}).values():
+            for user_suggestions in users.values():
+                for suggestion in user_suggestions:
+                    suggestions.append({key: value for key, value in suggestion.items()
+                                        if key in FIELD_TOKENS and value})
+    suggestions = [suggestion for suggestion in suggestions if 'title' in suggestion]
+    if not suggestions:
+        raise ValueError(f"No suggestions with a title in {db_path}")
+    return suggestions
+
+
+def aliases(token: str) -> list[str]:
+    # Plain aliases of a keyword, the ones with regex syntax (e.g. 'link.*') can't be written as they are
+    names = [alias.replace(r'\s', ' ') for alias in keywords[token].split('|')]
+    return [name for name in names if not any(char in name for char in '.*()?[]')]
+
+
+def render_suggestion(suggestion: dict, rng: random.Random) -> str:
+    """Writes a suggestion back as a message would: the title first, then the other fields in any order."""
+    fields = [key for key in suggestion if key != 'title']
+    rng.shuffle(fields)
+    lines = []
+    for field in ['title'] + fields:
+        alias = rng.choice(aliases(FIELD_TOKENS[field]) or [field])
+        alias = alias.capitalize() if rng.random() < 0.7 else alias
+        lines.append(rng.choice(HEADER_FORMATS).format(alias=alias) + suggestion[field])
+    return '\n'.join(lines)
+
+
+def suggestion_message(suggestions: list[dict], rng: random.Random) -> str:
+    parts = [render_suggestion(rng.choice(suggestions), rng) for _ in range(rng.choice((1, 1, 1, 2, 3)))]
+    if rng.random() < 0.3:
+        parts.insert(0, chat_message(rng))
+    return '\n\n'.join(parts)
+
+
+def chat_message(rng: random.Random) -> str:
+    return ' '.join(rng.choice(CHAT_WORDS) for _ in range(rng.randint(1, 40)))
+
+
+def adversarial_message(suggestions: list[dict], rng: random.Random, length: int, kind: str = None) -> str:
+    """
+    A message of about `length` characters that passes the prefilter and is expensive for the lexer, the parser or
+    the cleaning regexes.
+    """
+    kind = kind or rng.choice(ADVERSARIAL_KINDS)
+    if kind == 'long_line':
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append(rng.choice(CHAT_WORDS))
+        return 'Title: ' + ' '.join(words)
+    if kind == 'colon_storm':
+        return 'Title:' + ':' * length
+    if kind == 'decorations':
+        return '**__' * (length // 4) + 'Title: ' + '_*`' * (length // 12) + 'x:y'
+    if kind == 'many_fields':
+        return 'Title: x\n' + 'Author: y\n' * (length // 10)
+    if kind == 'no_newlines':
+        text = ''
+        while len(text) < length:
+            text += render_suggestion(rng.choice(suggestions), rng).replace('\n', ' ') + ' '
+        return text
+    if kind == 'near_headers':
+        # Keywords followed by more than 5 characters before the colon, they are text and not headers
+        return 'Title: x\n' + 'titles of books: ' * (length // 17)
+    raise ValueError(f"Unknown adversarial kind '{kind}'")
+
+
+def build_corpus(db_path: str = 'db.json', size: int = 2000, noise_ratio: float = 0.5,
+                 adversarial_ratio: float = 0.01, adversarial_length: int = 2000,
+                 seed: int = 0) -> list[tuple[str, str]]:
+    """
+    Builds `size` messages as (kind, content) pairs, kind being 'suggestion', 'noise' or 'adversarial'. Suggestion
+    messages are rebuilt from the suggestions stored in `db_path`. The same arguments always build the same corpus.
+    """
+    rng = random.Random(seed)
+    suggestions = load_suggestions(db_path)
+    corpus = []
+    for _ in range(size):
+        draw = rng.random()
+        if draw < adversarial_ratio:
+            corpus.append(('adversarial', adversarial_message(suggestions, rng, adversarial_length)))
+        elif draw < adversarial_ratio + noise_ratio:
+            corpus.append(('noise', chat_message(rng)))
+        else:
+            corpus.append(('suggestion', suggestion_message(suggestions, rng)))
+    return corpus
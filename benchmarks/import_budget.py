@@ -0,0 +1,104 @@
+"""
+Import-time budget of a restart. Every module is imported in a fresh interpreter (`python -X importtime`), from an
+empty working directory, and the fastest of --repeat imports is compared with its budget. Also checks that the
+frozen lexer and parser tables are up to date and that importing writes nothing: no tables, no parser.out.
+Exits with 1 when a budget is exceeded, a table is stale or a file was written.
+
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget suggestion_yacc=60 --budget main=800
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds, main is mostly discord.py
+BUDGETS = {
+    'suggestion_lexer': 50.0,
+    'suggestion_yacc': 100.0,
+    'main': 1500.0,
+}
+
+# Their imports must not write in the working directory either, main opens its log file there
+READ_ONLY = ('suggestion_lexer', 'suggestion_yacc')
+
+
+def import_time(module: str, directory: str) -> float:
+    """Milliseconds `module` and its imports took to import in a new interpreter run in `directory`."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (ROOT, env.get('PYTHONPATH'))))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"], cwd=directory, env=env,
+                            capture_output=True, text=True, check=True)
+    for line in reversed(result.stderr.splitlines()):
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e3
+    raise RuntimeError(f"No import time of {module} in:\n{result.stderr}")
+
+
+def snapshot(directory: str) -> dict[str, int]:
+    """Modification time of every file under `directory`, bytecode caches and .git left out."""
+    files = {}
+    for path, directories, names in os.walk(directory):
+        directories[:] = [name for name in directories if name not in ('.git', '__pycache__')]
+        for name in names:
+            file = os.path.join(path, name)
+            files[file] = os.stat(file).st_mtime_ns
+    return files
+
+
+def check(budgets: dict[str, float], repeat: int) -> list[str]:
+    """Returns a description of every failure."""
+    failures = []
+    before = snapshot(ROOT)
+    for module, budget in budgets.items():
+        with tempfile.TemporaryDirectory(prefix='import-') as directory:
+            # The first import compiles the bytecode caches
+            import_time(module, directory)
+            best = min(import_time(module, directory) for _ in range(repeat))
+            written = os.listdir(directory)
+        status = "ok" if best <= budget else "OVER BUDGET"
+        print(f"{module:<20}{best:>9.1f} ms  budget {budget:>7.1f} ms  {status}")
+        if best > budget:
+            failures.append(f"{module} took {best:.1f} ms, over its budget of {budget:.1f} ms")
+        if module in READ_ONLY and written:
+            failures.append(f"Importing {module} wrote {', '.join(sorted(written))}")
+
+    changed = sorted(os.path.relpath(path, ROOT) for path, mtime in snapshot(ROOT).items()
+                     if before.get(path) != mtime)
+    if changed:
+        failures.append(f"Imports wrote {', '.join(changed)}")
+
+    sys.path.insert(0, ROOT)
+    import suggestion_yacc
+    if not suggestion_yacc.tables_are_frozen():
+        failures.append("The frozen tables are stale, run `python suggestion_yacc.py --freeze`")
+    return failures
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Checks the import time of the bot's modules against a budget.")
+    parser.add_argument('--budget', action='append', default=[], metavar='MODULE=MS',
+                        help="budget of a module in milliseconds, replaces the default one or adds a module")
+    parser.add_argument('--repeat', type=int, default=5, help="imports of each module, the fastest is kept")
+    args = parser.parse_args(argv)
+
+    budgets = dict(BUDGETS)
+    for budget in args.budget:
+        module, _, milliseconds = budget.partition('=')
+        budgets[module] = float(milliseconds)
+
+    failures = check(budgets, args.repeat)
+    if failures:
+        for failure in failures:
+            print(failure)
+        return 1
+    print("Every import is within its budget and wrote nothing")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Load test of the whole on_message path (prefilter -> parse -> add_result_to_db -> embeds -> outbox -> channel.send)
+without Discord. A real DiscordBot is created on a temporary database, never logs in, and is handed fake messages
+of M guilds at N messages/sec. Channels are in-memory sinks that answer sends after a simulated API latency.
+
+Every run reports the throughput, the p50/p99 latency of each stage of on_message and of the whole call, and the
+lag of the event loop. With several guild counts, runs go from the smallest to the largest and stop at the first one
+the bot can't keep up with: less than 90% of the offered rate handled, or an end-to-end p99 over --slo.
+
+    python -m benchmarks.load --rate 200 --duration 10 --guilds 1,10,100,1000 --storage tinydb
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import discord
+
+import main
+from benchmarks.corpus import build_corpus
+from benchmarks.parser_bench import percentile
+
+
+class SinkChannel:
+    """Stands in for a text channel. Sends are counted, and answered after `latency` seconds like an API call."""
+
+    def __init__(self, channel_id: int, guild: 'FakeGuild', latency: float) -> None:
+        self.id = channel_id
+        self.guild = guild
+        self.latency = latency
+        self.type = discord.ChannelType.text if guild is not None else discord.ChannelType.private
+        self.mention = f"<#{channel_id}>"
+        self.sent = 0
+        self.embeds = 0
+        self.messages: list[tuple[str | None, list]] = []
+
+    async def send(self, content: str = None, **kwargs) -> 'FakeMessage':
+        await asyncio.sleep(self.latency)
+        self.sent += 1
+        embeds = list(kwargs.get('embeds') or ()) + ([kwargs['embed']] if kwargs.get('embed') else [])
+        self.embeds += len(embeds)
+        self.messages.append((content, embeds))
+        return FakeMessage(next(MESSAGE_IDS), content or '', BOT_USER, self.guild, self)
+
+    def permissions_for(self, member) -> discord.Permissions:
+        return discord.Permissions.all()
+
+    async def history(self, **kwargs):
+        # No history is kept, a scan finds nothing
+        return
+        yield
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, name: str = None) -> None:
+        self.id = guild_id
+        self.name = name or f"Load test guild {guild_id}"
+        self.channels: dict[int, SinkChannel] = {}
+        self.members: dict[int, FakeUser] = {}
+
+    def channel(self, channel_id: int, latency: float) -> SinkChannel:
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = SinkChannel(channel_id, self, latency)
+        return channel
+
+    def get_member(self, user_id: int) -> 'FakeUser | None':
+        return self.members.get(user_id)
+
+
+class FakeUser(SinkChannel):
+    """A member, its DMs are a sink too."""
+
+    def __init__(self, user_id: int, name: str = None, bot: bool = False, latency: float = 0.0) -> None:
+        super().__init__(user_id, None, latency)
+        self.name = self.display_name = name or f"reader{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.bot = bot
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, content: str, author: FakeUser, guild: FakeGuild,
+                 channel: SinkChannel) -> None:
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+        self.attachments = []
+        self.mentions = []
+        self.embeds = []
+        self.edits = []
+
+    async def edit(self, content: str = None, **kwargs) -> 'FakeMessage':
+        # .scan edits its progress message
+        await asyncio.sleep(self.channel.latency)
+        self.edits.append(content)
+        if content is not None:
+            self.content = content
+        return self
+
+
+MESSAGE_IDS = itertools.count(1_000_000_000_000_000_000)
+BOT_USER = FakeUser(1, "Load test bot", bot=True)
+
+
+def make_messages(guild_count: int, count: int, suggestion_ratio: float, channels: int, users: int,
+                  send_latency: float, seed: int) -> list[FakeMessage]:
+    """`count` messages spread at random over the channels of the guilds, with contents from the benchmark corpus."""
+    rng = random.Random(seed)
+    guilds = [FakeGuild(1000 + index) for index in range(guild_count)]
+    channel_lists = [[guild.channel(guild.id * 100 + index, send_latency) for index in range(channels)]
+                     for guild in guilds]
+    authors = [FakeUser(10_000 + index) for index in range(users)]
+    corpus = build_corpus(size=count, noise_ratio=1 - suggestion_ratio, adversarial_ratio=0, seed=seed)
+    messages = []
+    for _, content in corpus:
+        index = rng.randrange(guild_count)
+        channel = rng.choice(channel_lists[index])
+        messages.append(FakeMessage(next(MESSAGE_IDS), content, rng.choice(authors), guilds[index], channel))
+    return messages
+
+
+def summary(samples: list[float]) -> dict:
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'p50_ms': round(percentile(ordered, 0.50) * 1e3, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1e3, 3),
+        'max_ms': round(ordered[-1] * 1e3, 3),
+    }
+
+
+async def sample_lag(samples: list[float], interval: float = 0.01) -> None:
+    # How late a sleep wakes up is how long the loop was busy with something else
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run(guild_count: int, options: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory(prefix='load-') as directory:
+        return await run_in(directory, guild_count, options)
+
+
+@contextlib.contextmanager
+def stage_timings():
+    """Collects the raw timings on_message records in MESSAGE_STAGE_SECONDS, as stage -> [seconds]."""
+    stages: dict[str, list[float]] = {}
+    observe = main.MESSAGE_STAGE_SECONDS.observe
+
+    def record(value: float, label: str = '') -> None:
+        stages.setdefault(label, []).append(value)
+        observe(value, label)
+
+    main.MESSAGE_STAGE_SECONDS.observe = record
+    try:
+        yield stages
+    finally:
+        del main.MESSAGE_STAGE_SECONDS.observe
+
+
+def create_bot(directory: str, storage: str, cls=main.DiscordBot) -> main.DiscordBot:
+    """A bot with its database in `directory` (or in memory), and its periodic flush started like after login."""
+    main.config['storage'] = storage
+    main.config['database'] = os.path.join(directory, 'db.json' if storage == 'tinydb' else 'db.sqlite3')
+    main.config['migrate_from'] = None
+    bot = cls()
+    bot.flush_task.change_interval(seconds=main.config.get("flush_interval", 30.0))
+    bot.flush_task.start()
+    return bot
+
+
+def outcome_counts(before: dict) -> dict:
+    """Outcomes counted by on_message since `before` (a copy of MESSAGES.values)."""
+    return {outcome: count - before.get(outcome, 0) for outcome, count in main.MESSAGES.values.items()
+            if count - before.get(outcome, 0)}
+
+
+async def run_in(directory: str, guild_count: int, options: argparse.Namespace) -> dict:
+    bot = create_bot(directory, options.storage)
+    messages = make_messages(guild_count, int(options.rate * options.duration), options.suggestion_ratio,
+                             options.channels, options.users, options.send_latency, options.seed)
+    outcomes_before = dict(main.MESSAGES.values)
+    latencies, lag = [], []
+    lag_task = asyncio.create_task(sample_lag(lag))
+
+    async def handle(message: FakeMessage) -> None:
+        start = time.perf_counter()
+        await bot.on_message(message)
+        latencies.append(time.perf_counter() - start)
+
+    try:
+        with stage_timings() as stages:
+            start = time.perf_counter()
+            tasks = []
+            for index, message in enumerate(messages):
+                delay = start + index / options.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(handle(message)))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+        flush_start = time.perf_counter()
+        await bot.database.flush()
+        flush_time = time.perf_counter() - flush_start
+    finally:
+        lag_task.cancel()
+        await bot.close()
+
+    throughput = len(messages) / elapsed
+    total = summary(latencies)
+    channels = {message.channel for message in messages}
+    return {
+        'guilds': guild_count,
+        'storage': options.storage,
+        'offered_rate': options.rate,
+        'messages': len(messages),
+        'elapsed_s': round(elapsed, 3),
+        'throughput': round(throughput, 1),
+        'outcomes': outcome_counts(outcomes_before),
+        'sends': sum(channel.sent for channel in channels),
+        'embeds': sum(channel.embeds for channel in channels),
+        'final_flush_ms': round(flush_time * 1e3, 3),
+        'end_to_end': total,
+        'stages': {stage: summary(samples) for stage, samples in stages.items()},
+        'loop_lag': summary(lag),
+        'kept_up': throughput >= 0.9 * options.rate and total.get('p99_ms', 0) <= options.slo * 1e3,
+    }
+
+
+def print_run(result: dict) -> None:
+    status = "kept up" if result['kept_up'] else "FELL BEHIND"
+    print(f"{result['guilds']} guilds ({result['storage']}): {result['throughput']:.0f}/{result['offered_rate']:.0f} "
+          f"messages/s, {result['sends']} sends, {status}")
+    rows = [('end_to_end', result['end_to_end']), *result['stages'].items(), ('loop_lag', result['loop_lag'])]
+    for name, values in rows:
+        if values['count']:
+            print(f"  {name:<12}{values['count']:>8}  p50 {values['p50_ms']:>9.3f} ms  p99 {values['p99_ms']:>9.3f} ms"
+                  f"  max {values['max_ms']:>9.3f} ms")
+
+
+async def sweep(options: argparse.Namespace) -> list[dict]:
+    results = []
+    for guild_count in options.guilds:
+        result = await run(guild_count, options)
+        results.append(result)
+        if not result['kept_up'] and not options.keep_going:
+            break
+    return results
+
+
+def main_cli(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Drives DiscordBot.on_message with fake messages.")
+    parser.add_argument('--rate', type=float, default=200.0, help="messages per second")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of messages per run")
+    parser.add_argument('--guilds', type=lambda text: [int(count) for count in text.split(',')], default=[1, 10, 100],
+                        help="guild counts to run with, comma separated")
+    parser.add_argument('--channels', type=int, default=5, help="channels per guild")
+    parser.add_argument('--users', type=int, default=50, help="members posting the messages")
+    parser.add_argument('--suggestion-ratio', type=float, default=0.2, help="ratio of messages with suggestions")
+    parser.add_argument('--storage', choices=('tinydb', 'sqlite'), default='tinydb')
+    parser.add_argument('--send-latency', type=float, default=0.05, help="seconds a send takes")
+    parser.add_argument('--slo', type=float, default=1.0, help="largest accepted end-to-end p99, in seconds")
+    parser.add_argument('--keep-going', action='store_true', help="run every guild count, even after falling behind")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="file the results are written to, as JSON")
+    parser.add_argument('--log-level', default='WARNING', help="level of the bot's logger during the runs")
+    args = parser.parse_args(argv)
+
+    main.logger.setLevel(args.log_level)
+    logging.getLogger('discord').setLevel(logging.WARNING)
+    results = asyncio.run(sweep(args))
+    main.log_listener.stop()
+
+    for result in results:
+        print_run(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    limit = next((result['guilds'] for result in results if not result['kept_up']), None)
+    if limit is None:
+        print(f"Kept up with every guild count at {args.rate:.0f} messages/s")
+    else:
+        print(f"Fell behind at {limit} guilds")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
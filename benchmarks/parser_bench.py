@@ -0,0 +1,229 @@
+"""
+Benchmark of the parsing pipeline of on_message, stage by stage, on a corpus rebuilt from db.json (see corpus.py):
+
+    prefilter     SuggestionPreFilter.check, on every message
+    clean_before  normalize_message (clean_string_before_parsing and lowercasing), on the messages past the prefilter
+    lex           tokenizing the normalized messages with the lexer of --engine
+    parse         suggestion_yacc parser, lexing included, on the normalized messages
+    clean_after   clean_text_after_parsing, on the descriptions the parser found
+
+Reports messages/sec, p50/p99 latency and the memory allocated per message of each stage and writes them to --output.
+Timings depend on the machine, so nothing is compared by default: save a baseline with --save-baseline on the machine
+the comparisons run on, then compare with --baseline. Exits with 1 when a stage got slower, or allocates more, than
+--threshold allows.
+
+    python -m benchmarks.parser_bench --output results.json
+    python -m benchmarks.parser_bench --save-baseline before.json
+    python -m benchmarks.parser_bench --baseline before.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import suggestion_yacc
+from benchmarks.corpus import build_corpus
+from parsing import normalize_message
+from prefilter import SuggestionPreFilter
+from utils import clean_text_after_parsing
+
+# Measures compared with the baseline, and whether a higher value is better
+MEASURES = {
+    'messages_per_sec': True,
+    'p50_us': False,
+    'p99_us': False,
+    'alloc_mean_bytes': False,
+}
+
+
+def lex(lexer, text: str) -> int:
+    lexer.input(text)
+    count = 0
+    while lexer.token() is not None:
+        count += 1
+    return count
+
+
+def stage_inputs(corpus: list[tuple[str, str]], engine: str) -> dict[str, tuple]:
+    """Runs the pipeline once to collect what each stage is given. Returns stage -> (function, inputs)."""
+    prefilter = SuggestionPreFilter()
+    parser = suggestion_yacc.make_parser()
+    lexer = suggestion_yacc.lexers[engine].clone()
+
+    messages = [content for _, content in corpus]
+    candidates = [content for content in messages if prefilter.check(content)]
+    texts = [normalize_message(content) for content in candidates]
+    descriptions = []
+    for text in texts:
+        for suggestion in parser.parse(text, lexer=lexer) or ():
+            descriptions.extend(value for field, value in suggestion if field == 'description')
+
+    return {
+        'prefilter': (prefilter.check, messages),
+        'clean_before': (normalize_message, candidates),
+        'lex': (lambda text: lex(lexer, text), texts),
+        'parse': (lambda text: parser.parse(text, lexer=lexer), texts),
+        'clean_after': (clean_text_after_parsing, descriptions),
+    }
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure(function, inputs: list, repeat: int) -> dict:
+    """
+    Latency and throughput over `repeat` passes, after a warm-up one, then allocations in a traced pass. The fastest
+    time of each message and the fastest pass are kept, they are the least disturbed by the rest of the machine.
+    """
+    if not inputs:
+        return {'inputs': 0}
+    for item in inputs:
+        function(item)
+
+    latencies = [float('inf')] * len(inputs)
+    fastest_pass = float('inf')
+    clock = time.perf_counter_ns
+    for _ in range(repeat):
+        total = 0
+        for index, item in enumerate(inputs):
+            start = clock()
+            function(item)
+            elapsed = clock() - start
+            total += elapsed
+            latencies[index] = min(latencies[index], elapsed)
+        fastest_pass = min(fastest_pass, total)
+    latencies.sort()
+
+    allocated = []
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            function(item)
+            allocated.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'inputs': len(inputs),
+        'messages_per_sec': round(len(inputs) / (fastest_pass / 1e9), 1),
+        'p50_us': round(percentile(latencies, 0.50) / 1e3, 2),
+        'p99_us': round(percentile(latencies, 0.99) / 1e3, 2),
+        'max_us': round(latencies[-1] / 1e3, 2),
+        'alloc_mean_bytes': round(sum(allocated) / len(allocated)),
+        'alloc_max_bytes': max(allocated),
+    }
+
+
+def run(corpus_options: dict, engine: str = 'ply', repeat: int = 5) -> dict:
+    corpus = build_corpus(**corpus_options)
+    kinds = {}
+    for kind, _ in corpus:
+        kinds[kind] = kinds.get(kind, 0) + 1
+
+    results = {
+        'python': platform.python_version(),
+        'machine': f"{platform.system()} {platform.machine()}",
+        'grammar_version': suggestion_yacc.GRAMMAR_VERSION,
+        'engine': engine,
+        'repeat': repeat,
+        'corpus': {**corpus_options, 'kinds': kinds},
+        'stages': {},
+    }
+    for stage, (function, inputs) in stage_inputs(corpus, engine).items():
+        results['stages'][stage] = measure(function, inputs, repeat)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Returns a description of every measure that regressed by more than `threshold` (a ratio) from the baseline."""
+    if results['corpus'] != baseline['corpus'] or results['engine'] != baseline['engine']:
+        raise ValueError("The baseline was measured on a different corpus or engine, it can't be compared")
+    regressions = []
+    for stage, measures in results['stages'].items():
+        reference = baseline['stages'].get(stage)
+        if not reference or not measures['inputs']:
+            continue
+        for name, higher_is_better in MEASURES.items():
+            new, old = measures[name], reference[name]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{stage} {name}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def print_report(results: dict) -> None:
+    kinds = ', '.join(f"{count} {kind}" for kind, count in results['corpus']['kinds'].items())
+    print(f"Corpus: {kinds} (engine {results['engine']}, python {results['python']})")
+    print(f"{'stage':<13}{'inputs':>8}{'msg/s':>12}{'p50 us':>10}{'p99 us':>10}{'max us':>11}{'alloc B':>10}")
+    for stage, measures in results['stages'].items():
+        if not measures['inputs']:
+            print(f"{stage:<13}{0:>8}")
+            continue
+        print(f"{stage:<13}{measures['inputs']:>8}{measures['messages_per_sec']:>12.0f}{measures['p50_us']:>10.1f}"
+              f"{measures['p99_us']:>10.1f}{measures['max_us']:>11.1f}{measures['alloc_mean_bytes']:>10}")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the stages of the suggestion parser.")
+    parser.add_argument('--db', default='db.json', help="TinyDB file the suggestions are taken from")
+    parser.add_argument('--size', type=int, default=2000, help="number of messages in the corpus")
+    parser.add_argument('--noise', type=float, default=0.5, help="ratio of chat messages")
+    parser.add_argument('--adversarial', type=float, default=0.01, help="ratio of adversarial messages")
+    parser.add_argument('--adversarial-length', type=int, default=2000,
+                        help="length of adversarial messages (2000 is Discord's limit)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', choices=sorted(suggestion_yacc.lexers), default='ply')
+    parser.add_argument('--repeat', type=int, default=5, help="timed passes over the corpus")
+    parser.add_argument('--output', help="file the results are written to, as JSON")
+    parser.add_argument('--baseline', metavar='FILE', help="results of a previous run on this machine to compare with")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="largest accepted regression, as a ratio of the baseline (0.25 = 25%%)")
+    parser.add_argument('--save-baseline', metavar='FILE', help="file the results are written to, as a baseline")
+    args = parser.parse_args(argv)
+
+    corpus_options = {
+        'db_path': args.db,
+        'size': args.size,
+        'noise_ratio': args.noise,
+        'adversarial_ratio': args.adversarial,
+        'adversarial_length': args.adversarial_length,
+        'seed': args.seed,
+    }
+    results = run(corpus_options, args.engine, args.repeat)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved the baseline to {args.save_baseline}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    try:
+        regressions = compare(results, baseline, args.threshold)
+    except ValueError as e:
+        print(e)
+        return 2
+    if regressions:
+        print(f"Regressions over {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regression over {args.threshold:.0%} from the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Replays traffic recorded by EventRecorder (set "record_file" in config.json) through a DiscordBot, offline. Messages
+are handed to on_message and application commands are run as the equivalent prefix commands, at the recorded pace
+divided by --speed (0 replays as fast as possible). The bot runs on an in-memory database by default, or on a
+temporary TinyDB or SQLite one with --storage. Sends go to in-memory sinks answered after --send-latency seconds.
+
+Reports the end-to-end p50/p99 of messages and commands, of every stage of on_message and the event loop lag, and
+compares them with --baseline, a previous replay of the same recording. Exits with 1 past --threshold.
+
+    python -m benchmarks.replay traffic.log.1.gz traffic.log --speed 10 --output today.json
+    python -m benchmarks.replay traffic.log.1.gz traffic.log --speed 10 --baseline yesterday.json
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import sys
+import tempfile
+import time
+
+import discord
+from discord.ext import commands
+
+import main
+from benchmarks.load import (BOT_USER, MESSAGE_IDS, FakeGuild, FakeMessage, FakeUser, SinkChannel, create_bot,
+                             outcome_counts, sample_lag, stage_timings, summary)
+
+
+class ReplayContext(commands.Context):
+    """Context whose replies go to the sink channel of the replayed message instead of the API."""
+
+    async def send(self, content: str = None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+
+class ReplayBot(main.DiscordBot):
+    def __init__(self) -> None:
+        super().__init__()
+        # Commands need the bot's own user, nobody replayed is its owner
+        self._connection.user = discord.ClientUser(state=self._connection, data={
+            'id': BOT_USER.id, 'username': BOT_USER.name, 'discriminator': '0', 'avatar': None, 'bot': True,
+        })
+        self.owner_id = BOT_USER.id
+        self.command_errors: dict[str, int] = {}
+
+    async def get_context(self, origin, *, cls=ReplayContext):
+        return await super().get_context(origin, cls=cls)
+
+    async def on_command_error(self, context: commands.Context, error) -> None:
+        name = type(error).__name__
+        self.command_errors[name] = self.command_errors.get(name, 0) + 1
+
+
+def load_events(paths: list[str]) -> list[dict]:
+    """The events of the recorded files (plain or gzip compressed), in time order."""
+    events = []
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as file:
+            events.extend(json.loads(line) for line in file if line.strip())
+    events.sort(key=lambda event: event['t'])
+    return events
+
+
+def recording_digest(events: list[dict]) -> str:
+    digest = hashlib.sha1()
+    for event in events:
+        digest.update(json.dumps(event, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def build_messages(events: list[dict], bot: ReplayBot, send_latency: float) -> list[tuple[float, str, FakeMessage]]:
+    """(time offset, 'message' or 'command', message) of every event, with the guilds, channels and members seen."""
+    prefix = main.config["prefix"]
+    guilds: dict[int, FakeGuild] = {}
+    users: dict[int, FakeUser] = {}
+    direct: dict[int, SinkChannel] = {}
+    messages = []
+    start = events[0]['t'] if events else 0.0
+    for event in events:
+        user = users.get(event['u'])
+        if user is None:
+            user = users[event['u']] = FakeUser(event['u'], event.get('n'), bool(event.get('b')), send_latency)
+        if event.get('g') is not None:
+            guild = guilds.get(event['g'])
+            if guild is None:
+                guild = guilds[event['g']] = FakeGuild(event['g'], event.get('gn'))
+            guild.members[user.id] = user
+            channel = guild.channel(event['c'], send_latency)
+        else:
+            guild = None
+            channel = direct.setdefault(event['c'], SinkChannel(event['c'], None, send_latency))
+
+        content = event['x'] if event['e'] == 'm' else prefix + event['x']
+        message = FakeMessage(event.get('id') or next(MESSAGE_IDS), content, user, guild, channel)
+        # Contexts read the connection state from the message
+        message._state = bot._connection
+        messages.append((event['t'] - start, 'command' if content.startswith(prefix) else 'message', message))
+    return messages
+
+
+async def replay(directory: str, events: list[dict], options: argparse.Namespace) -> dict:
+    main.config['record_file'] = None
+    bot = create_bot(directory, options.storage, cls=ReplayBot)
+    # What login does before setup_hook: events (e.g. on_command_completion) are dispatched on the running loop
+    await bot._async_setup_hook()
+    await bot.load_cogs()
+    messages = build_messages(events, bot, options.send_latency)
+
+    outcomes_before = dict(main.MESSAGES.values)
+    latencies: dict[str, list[float]] = {'message': [], 'command': []}
+    lag = []
+    lag_task = asyncio.create_task(sample_lag(lag))
+
+    async def handle(kind: str, message: FakeMessage) -> None:
+        start = time.perf_counter()
+        try:
+            await bot.on_message(message)
+        except Exception as e:
+            # Not handled by on_command_error, e.g. a command using something the fakes don't have
+            name = type(e).__name__
+            bot.command_errors[name] = bot.command_errors.get(name, 0) + 1
+        latencies[kind].append(time.perf_counter() - start)
+
+    try:
+        with stage_timings() as stages:
+            start = time.perf_counter()
+            tasks = []
+            for offset, kind, message in messages:
+                if options.speed > 0:
+                    delay = start + offset / options.speed - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(handle(kind, message)))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+    finally:
+        lag_task.cancel()
+        await bot.close()
+
+    return {
+        'recording': recording_digest(events),
+        'events': len(events),
+        'storage': options.storage,
+        'speed': options.speed,
+        'elapsed_s': round(elapsed, 3),
+        'throughput': round(len(messages) / elapsed, 1) if elapsed else 0.0,
+        'outcomes': outcome_counts(outcomes_before),
+        'command_errors': bot.command_errors,
+        'end_to_end': {kind: summary(samples) for kind, samples in latencies.items()},
+        'stages': {stage: summary(samples) for stage, samples in stages.items()},
+        'loop_lag': summary(lag),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Every p50/p99 that grew by more than `threshold` (a ratio) from the baseline."""
+    if results['recording'] != baseline['recording'] or results['speed'] != baseline['speed']:
+        raise ValueError("The baseline is a replay of another recording or at another speed, it can't be compared")
+    regressions = []
+    for group in ('end_to_end', 'stages'):
+        for name, values in results[group].items():
+            reference = baseline[group].get(name, {})
+            for measure in ('p50_ms', 'p99_ms'):
+                new, old = values.get(measure), reference.get(measure)
+                if new is None or not old:
+                    continue
+                change = (new - old) / old
+                if change > threshold:
+                    regressions.append(f"{name} {measure}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    print(f"Replayed {results['events']} events in {results['elapsed_s']:.1f}s ({results['throughput']:.0f}/s, "
+          f"storage {results['storage']}): {results['outcomes']}")
+    if results['command_errors']:
+        print(f"Command errors: {results['command_errors']}")
+    rows = [*results['end_to_end'].items(), *results['stages'].items(), ('loop_lag', results['loop_lag'])]
+    for name, values in rows:
+        if values['count']:
+            print(f"  {name:<12}{values['count']:>8}  p50 {values['p50_ms']:>9.3f} ms  p99 {values['p99_ms']:>9.3f} ms"
+                  f"  max {values['max_ms']:>9.3f} ms")
+
+
+def main_cli(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replays recorded traffic through DiscordBot offline.")
+    parser.add_argument('files', nargs='+', help="recorded files, plain or .gz")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="replay speed: 1 is the recorded pace, 10 ten times faster, 0 as fast as possible")
+    parser.add_argument('--storage', choices=('memory', 'tinydb', 'sqlite'), default='memory')
+    parser.add_argument('--send-latency', type=float, default=0.0, help="seconds a send takes")
+    parser.add_argument('--output', help="file the results are written to, as JSON")
+    parser.add_argument('--baseline', help="results of a previous replay of the same recording")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="largest accepted latency growth, as a ratio of the baseline (0.25 = 25%%)")
+    parser.add_argument('--log-level', default='WARNING', help="level of the bot's logger during the replay")
+    args = parser.parse_args(argv)
+
+    events = load_events(args.files)
+    if not events:
+        print("No events to replay")
+        return 2
+    main.logger.setLevel(args.log_level)
+    logging.getLogger('discord').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix='replay-') as directory:
+        results = asyncio.run(replay(directory, events, args))
+    main.log_listener.stop()
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    try:
+        regressions = compare(results, baseline, args.threshold)
+    except ValueError as e:
+        print(e)
+        return 2
+    if regressions:
+        print(f"Regressions over {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regression over {args.threshold:.0%} from the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from actors import GuildWriters
+from index import SuggestionIndex
+from metrics import registry
+from storage import Storage
+
+STORAGE_SECONDS = registry.histogram('bot_storage_seconds', "Time taken by storage calls.", 'call')
+STORAGE_OPERATIONS = registry.counter('bot_storage_operations_total', "Changes written to the storage.", 'operation')
+
+
+class GuildCache:
+    """
+    Write-behind cache of guild documents in front of a storage backend.
+
+    A guild is loaded from the storage the first time it is requested and is served from memory afterward, through
+    the lookups of a SuggestionIndex. Writes change the cached document right away and are queued, the queue is then
+    written to the storage in a single batch by `flush`, which runs periodically (see DiscordBot.flush_task) or as
+    soon as `flush_threshold` writes are pending.
+
+    Writes of a guild go through its GuildWriters queue, so they are applied in order, and every storage call runs
+    on a single dedicated thread.
+    """
+
+    def __init__(self, storage: Storage, flush_threshold: int = 50, logger: logging.Logger = None) -> None:
+        self.storage = storage
+        self.flush_threshold = flush_threshold
+        self.logger = logger or logging.getLogger('bot')
+        self.index = SuggestionIndex()
+        self.writers = GuildWriters()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage')
+        self.dirty: set[int] = set()
+        self.pending: list[tuple] = []
+        self._loading: dict[int, asyncio.Future] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+
+    async def get(self, server_id: int, server_name: str = None) -> dict | None:
+        """
+        Returns the cached guild document. If the guild is not in the storage it is created when a name is given,
+        otherwise None is returned.
+        """
+        server = self.index.servers.get(server_id)
+        if server is not None:
+            return server
+        if server_id not in self.index.missing:
+            await self._load(server_id)
+
+        if not self.index.has_server(server_id) and server_name is not None:
+            self.index.add_server({
+                'server_id': server_id,
+                'server_name': server_name,
+                'months': {},
+            })
+            self._queue(('add_server', server_id, server_name))
+            self.logger.info(f"Added server {server_name} to the database.")
+        return self.index.servers.get(server_id)
+
+    async def _load(self, server_id: int) -> None:
+        # Concurrent misses for the same guild share a single load
+        if server_id in self._loading:
+            await asyncio.shield(self._loading[server_id])
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, self.storage.get_server, server_id)
+        self._loading[server_id] = future
+        try:
+            with STORAGE_SECONDS.time('get_server'):
+                server = await future
+        finally:
+            self._loading.pop(server_id, None)
+        if server is not None:
+            self.index.add_server(server)
+        elif not self.index.has_server(server_id):
+            self.index.missing.add(server_id)
+
+    async def get_page(self, server_id: int, month: str, offset: int, size: int,
+                       user_id: str = None) -> tuple[list[tuple[str, dict]], int]:
+        """
+        Returns a page of a month's suggestions, as (user_id, suggestion) pairs, and the number of suggestions of the
+        month (see SuggestionIndex.get_page). Empty if the guild doesn't exist.
+        """
+        if await self.get(server_id) is None:
+            return [], 0
+        return self.index.get_page(server_id, month, offset, size, user_id)
+
+    async def add_suggestions(self, server_id: int, month: str, user_id: str, suggestions: list) -> None:
+        """Adds suggestions to a guild that is already cached (see `get`)."""
+        await self.writers.submit(server_id, self._add_suggestions, server_id, month, user_id, suggestions)
+
+    async def remove_suggestion(self, server_id: int, user_id: str, suggestion_id: str) -> bool:
+        """Removes a suggestion of a cached guild. Returns False if the user has no suggestion with that id."""
+        return await self.writers.submit(server_id, self._remove_suggestion, server_id, user_id, suggestion_id)
+
+    def is_ingested(self, server_id: int, message_id: str, content_hash: str) -> bool:
+        """Whether a message of a cached guild was already ingested with the same content."""
+        entry = self.index.servers[server_id].get('messages', {}).get(message_id)
+        return entry is not None and entry['hash'] == content_hash
+
+    async def ingest(self, server_id: int, message_id: str, content_hash: str, month: str, user_id: str,
+                     suggestions: list) -> str:
+        """
+        Adds the suggestions taken from a message to a cached guild and records them in its ingestion ledger.
+        Returns 'added' for a new message, 'unchanged' (nothing is written) if the message was already ingested with
+        the same content, or 'replaced' if its content changed, in which case the suggestions it produced before are
+        removed.
+        """
+        return await self.writers.submit(
+            server_id, self._ingest, server_id, message_id, content_hash, month, user_id, suggestions
+        )
+
+    async def revise(self, server_id: int, message_id: str, content_hash: str, user_id: str,
+                     suggestions: list) -> dict | None:
+        """
+        Updates the suggestions taken from an edited message of a cached guild. The new suggestions are matched by
+        position with the ones the message produced before: changed ones are updated in place, keeping their id and
+        getting the next 'revision', and the rest are added or removed. Returns the changed suggestions as
+        {'updated': [...], 'added': [...], 'removed': [...]}, or None if the message was never ingested or its
+        content didn't change.
+        """
+        return await self.writers.submit(
+            server_id, self._revise, server_id, message_id, content_hash, user_id, suggestions
+        )
+
+    async def forget(self, server_id: int, message_id: str) -> list:
+        """Removes the suggestions taken from a deleted message of a cached guild. Returns the removed suggestions."""
+        return await self.writers.submit(server_id, self._forget, server_id, message_id)
+
+    async def add_batch(self, server_id: int, entries: list, checkpoint: tuple = None) -> int:
+        """
+        Ingests many (message_id, content_hash, month, user_id, suggestions) entries into a cached guild and writes
+        them, together with any other pending change, to the storage in one batch. A (channel_id, checkpoint) pair
+        can be given to update a channel's scan checkpoint in the same batch. Returns the number of suggestions added.
+        """
+        count = await self.writers.submit(server_id, self._add_batch, server_id, entries, checkpoint)
+        await self.flush()
+        return count
+
+    async def set_settings(self, server_id: int, **settings) -> None:
+        """Updates settings of a cached guild."""
+        await self.writers.submit(server_id, self._set_settings, server_id, settings)
+
+    async def get_user_names(self) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.storage.get_user_names)
+
+    async def set_user_names(self, names: dict) -> None:
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.storage.set_user_names, names)
+
+    def _add_batch(self, server_id: int, entries: list, checkpoint: tuple | None) -> int:
+        count = 0
+        for message_id, content_hash, month, user_id, suggestions in entries:
+            if self._ingest(server_id, message_id, content_hash, month, user_id, suggestions) != 'unchanged':
+                count += len(suggestions)
+        if checkpoint is not None:
+            channel_id, data = checkpoint
+            self.index.servers[server_id].setdefault('checkpoints', {})[channel_id] = data
+            self._queue(('checkpoint', server_id, channel_id, data))
+        return count
+
+    def _ingest(self, server_id: int, message_id: str, content_hash: str, month: str, user_id: str,
+                suggestions: list) -> str:
+        messages = self.index.servers[server_id].setdefault('messages', {})
+        previous = messages.get(message_id)
+        if previous is not None:
+            if previous['hash'] == content_hash:
+                return 'unchanged'
+            for suggestion in self._ingested_suggestions(server_id, previous):
+                self._remove_suggestion(server_id, self.index.locate(suggestion['id'])[2], suggestion['id'])
+
+        if suggestions:
+            self._add_suggestions(server_id, month, user_id, suggestions)
+        entry = {'hash': content_hash, 'month': month, 'suggestions': [s['id'] for s in suggestions]}
+        messages[message_id] = entry
+        self._queue(('message', server_id, message_id, entry))
+        return 'added' if previous is None else 'replaced'
+
+    def _revise(self, server_id: int, message_id: str, content_hash: str, user_id: str,
+                suggestions: list) -> dict | None:
+        messages = self.index.servers[server_id].get('messages', {})
+        entry = messages.get(message_id)
+        if entry is None or entry['hash'] == content_hash:
+            return None
+
+        old = self._ingested_suggestions(server_id, entry)
+        changes = {'updated': [], 'added': suggestions[len(old):], 'removed': old[len(suggestions):]}
+        ids = []
+        for previous, suggestion in zip(old, suggestions):
+            ids.append(previous['id'])
+            fields = {key: value for key, value in suggestion.items() if key != 'id'}
+            if fields == {key: value for key, value in previous.items() if key not in ('id', 'revision')}:
+                continue
+            updated = {**fields, 'id': previous['id'], 'revision': previous.get('revision', 0) + 1}
+            self.index.replace_suggestion(updated)
+            self._queue(('update', server_id, updated))
+            changes['updated'].append(updated)
+
+        if changes['added']:
+            self._add_suggestions(server_id, entry['month'], user_id, changes['added'])
+            ids.extend(s['id'] for s in changes['added'])
+        for suggestion in changes['removed']:
+            self._remove_suggestion(server_id, self.index.locate(suggestion['id'])[2], suggestion['id'])
+
+        messages[message_id] = {'hash': content_hash, 'month': entry['month'], 'suggestions': ids}
+        self._queue(('message', server_id, message_id, messages[message_id]))
+        return changes
+
+    def _forget(self, server_id: int, message_id: str) -> list:
+        entry = self.index.servers[server_id].get('messages', {}).pop(message_id, None)
+        if entry is None:
+            return []
+        removed = self._ingested_suggestions(server_id, entry)
+        for suggestion in removed:
+            self._remove_suggestion(server_id, self.index.locate(suggestion['id'])[2], suggestion['id'])
+        self._queue(('message', server_id, message_id, None))
+        return removed
+
+    def _ingested_suggestions(self, server_id: int, entry: dict) -> list:
+        # Suggestions already removed with .rs are skipped
+        suggestions = []
+        for suggestion_id in entry['suggestions']:
+            location = self.index.locate(suggestion_id)
+            if location is not None and location[0] == server_id:
+                suggestions.append(self.index.get_suggestion(suggestion_id))
+        return suggestions
+
+    def _set_settings(self, server_id: int, settings: dict) -> None:
+        server = self.index.servers[server_id]
+        server['settings'] = {**server.get('settings', {}), **settings}
+        self._queue(('settings', server_id, server['settings']))
+
+    def _add_suggestions(self, server_id: int, month: str, user_id: str, suggestions: list) -> None:
+        self.index.add_suggestions(server_id, month, user_id, suggestions)
+        self._queue(('add', server_id, month, user_id, suggestions))
+
+    def _remove_suggestion(self, server_id: int, user_id: str, suggestion_id: str) -> bool:
+        location = self.index.locate(suggestion_id)
+        if location is None or location[0] != server_id or location[2] != user_id:
+            return False
+        self.index.remove_suggestion(suggestion_id)
+        self._queue(('remove', server_id, user_id, suggestion_id))
+        return True
+
+    def _queue(self, operation: tuple) -> None:
+        self.pending.append(operation)
+        self.dirty.add(operation[1])
+        # The task is kept so it isn't garbage collected mid-flush, and a single one is pending at a time
+        if len(self.pending) >= self.flush_threshold and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Writes every pending change to the storage in one batch."""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            operations, dirty = self.pending, self.dirty
+            self.pending, self.dirty = [], set()
+
+            loop = asyncio.get_running_loop()
+            try:
+                with STORAGE_SECONDS.time('apply'):
+                    await loop.run_in_executor(self.executor, self.storage.apply, operations)
+            except Exception as e:
+                # Keep the changes so the next flush retries them
+                self.pending[:0] = operations
+                self.dirty |= dirty
+                self.logger.error(f"Failed to flush {len(operations)} changes to the database\n{type(e).__name__}: {e}")
+                return
+            for operation in operations:
+                STORAGE_OPERATIONS.inc(operation[0])
+            self.logger.debug(f"Flushed {len(operations)} changes of {len(dirty)} servers to the database.")
+
+    async def close(self) -> None:
+        await self.writers.join()
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+        await self.writers.close()
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.storage.close)
+        self.executor.shutdown()
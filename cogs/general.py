@@ -106,6 +106,50 @@ class General(commands.Cog, name="general"):
             value=f"/ (Slash Commands) or {self.bot.config['prefix']} for normal commands",
             inline=False,
         )
+        embed.add_field(
+            name="Messages Parsed/Skipped:",
+            value=f"{self.bot.prefilter.parsed}/{self.bot.prefilter.skipped}",
+            inline=True,
+        )
+        cache_stats = self.bot.parsing.cache.stats()
+        embed.add_field(
+            name="Parse Cache Hits/Misses:",
+            value=f"{cache_stats['hits']}/{cache_stats['misses']} ({cache_stats['evictions']} evicted)",
+            inline=True,
+        )
+        embed_stats = self.bot.embeds.stats()
+        embed.add_field(
+            name="Embed Cache Hits/Misses:",
+            value=f"{embed_stats['hits']}/{embed_stats['misses']}",
+            inline=True,
+        )
+        send_stats = self.bot.outbox.stats()
+        embed.add_field(
+            name="Send Queue:",
+            value=f"{send_stats['depth']} queued, {send_stats['average_wait'] * 1000:.0f}ms average wait",
+            inline=True,
+        )
+        name_stats = self.bot.user_names.stats()
+        embed.add_field(
+            name="User Name Hit Rate:",
+            value=f"{name_stats['hit_rate']:.0%} ({name_stats['fetches']} fetched)",
+            inline=True,
+        )
+        loop_stats = self.bot.watchdog.stats()
+        embed.add_field(
+            name="Event Loop Lag:",
+            value=f"{loop_stats['last_lag'] * 1000:.0f}ms now, {loop_stats['p99_lag'] * 1000:.0f}ms p99, "
+                  f"{loop_stats['max_lag'] * 1000:.0f}ms max",
+            inline=True,
+        )
+        stalls = f"{loop_stats['stalls']} over {self.bot.watchdog.threshold * 1000:.0f}ms"
+        last_stall = loop_stats['last_stall']
+        if last_stall is not None:
+            stalls += f", last one {last_stall['lag'] * 1000:.0f}ms in `{last_stall['handler']}`"
+            if last_stall['where']:
+                stalls += f" at `{last_stall['where']}`"
+            stalls += f" <t:{int(last_stall['time'])}:R>"
+        embed.add_field(name="Event Loop Stalls:", value=stalls, inline=False)
         embed.set_footer(text=f"Requested by {context.author}")
         await context.send(embed=embed)
 
@@ -3,6 +3,8 @@ from discord import app_commands
 from discord.ext import commands
 from discord.ext.commands import Context
 
+from metrics import registry, Histogram
+
 
 class Owner(commands.Cog, name="owner"):
     def __init__(self, bot, database) -> None:
@@ -175,8 +177,37 @@ class Owner(commands.Cog, name="owner"):
         """
         embed = discord.Embed(description="Shutting down. Bye! :wave:", color=0xBEBEFE)
         await context.send(embed=embed)
+        await self.database.flush()
         await self.bot.close()
 
+    @commands.hybrid_command(
+        name="stats",
+        description="Summary of the bot's metrics.",
+    )
+    @commands.is_owner()
+    async def stats(self, context: Context) -> None:
+        """
+        Shows the count, average and 95th percentile of every latency histogram, and the counters and gauges.
+
+        :param context: The hybrid command context.
+        """
+        embed = discord.Embed(title="Metrics", color=0xBEBEFE)
+        for metric in registry.metrics.values():
+            lines = []
+            if isinstance(metric, Histogram):
+                for label, (_, total, count) in sorted(metric.values.items()):
+                    lines.append(f"`{label or 'all'}`: {count}, avg {total / count * 1000:.1f}ms, "
+                                 f"p95 ≤ {metric.quantile(0.95, label) * 1000:g}ms")
+            else:
+                for _, labels, value in metric.samples():
+                    label = ', '.join(labels.values()) or 'value'
+                    lines.append(f"`{label}`: {value:.2f}" if isinstance(value, float) else f"`{label}`: {value}")
+            if lines:
+                embed.add_field(name=metric.name, value='\n'.join(lines)[:1024], inline=False)
+        if not embed.fields:
+            embed.description = "Nothing was measured yet."
+        await context.send(embed=embed)
+
     @commands.hybrid_command(
         name="say",
         description="The bot will say anything you want.",
@@ -1,30 +1,38 @@
+import asyncio
+import time
+
+import discord
 from discord.ext import commands
 from discord.ext.commands import Context
 
-import asyncio
-from tinydb import Query
-from utils import next_month_year, get_embed_from_suggestion, clean_string_before_parsing
-from suggestion_yacc import parser
+from metrics import registry
+from outbox import BULK, INTERACTIVE
+from parsing import content_hash
+from utils import next_month_year
+from views import SuggestionPaginator
 import re
 
-SCAN_LIMIT = 100
+SCAN_LIMIT = 1000
+MAX_SCAN_LIMIT = 50000
+PROGRESS_INTERVAL = 2.0
+SCAN_PAGE_SIZE = 100
+
+COMMAND_SECONDS = registry.histogram('bot_command_seconds', "Time taken by the suggestion commands.", 'command')
 
 
 class Suggestions(commands.Cog, name="suggestions"):
     def __init__(self, bot, database) -> None:
         self.bot = bot
         self.database = database
+        self.started: dict[int, float] = {}
+
+    async def cog_before_invoke(self, context: Context) -> None:
+        self.started[id(context)] = time.perf_counter()
 
-    async def add_server_if_not_exists(self, server_id: int, server_name: str) -> None:
-        server = Query()
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(None, self.database.search, server.server_id == server_id)
-        if not result:
-            await loop.run_in_executor(None, self.database.insert, {
-                'server_id': server_id,
-                'server_name': server_name,
-                'months': {},
-            })
+    async def cog_after_invoke(self, context: Context) -> None:
+        started = self.started.pop(id(context), None)
+        if started is not None:
+            COMMAND_SECONDS.observe(time.perf_counter() - started, context.command.name)
 
     @commands.hybrid_command(
         name="s",
@@ -34,7 +42,7 @@ class Suggestions(commands.Cog, name="suggestions"):
                     "Example: !s 06/24 @rudrigu.",
     )
     async def s(self, context: Context, arg1=None, arg2=None) -> None:
-        await self.add_server_if_not_exists(context.guild.id, context.guild.name)
+        server = await self.database.get(context.guild.id, context.guild.name)
         mention_pattern = re.compile(r"<@!?(\d{17,19})>|(\d{17,19})")
         month_pattern = re.compile(r"\d{2}/\d{2}")
 
@@ -52,7 +60,7 @@ class Suggestions(commands.Cog, name="suggestions"):
                 user_id = str(context.author.id)
                 month = arg1
             else:
-                await context.send("Invalid arguments.")
+                await self.bot.outbox.send(context, "Invalid arguments.")
                 return
 
         # Two arguments : month and user
@@ -62,40 +70,33 @@ class Suggestions(commands.Cog, name="suggestions"):
                 if month_pattern.match(arg2):
                     month = arg2
                 else:
-                    await context.send("Invalid arguments.")
+                    await self.bot.outbox.send(context, "Invalid arguments.")
                     return
             elif month_pattern.match(arg1):
                 month = arg1
                 if match := mention_pattern.match(arg2):
                     user_id = match.group(1) if match.group(1) else match.group(2)
                 else:
-                    await context.send("Invalid arguments.")
+                    await self.bot.outbox.send(context, "Invalid arguments.")
                     return
             else:
-                await context.send("Invalid arguments.")
+                await self.bot.outbox.send(context, "Invalid arguments.")
                 return
 
-        server = Query()
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(None, self.database.search, server.server_id == context.guild.id)
-
-        if result:
-            if month not in result[0]['months']:
-                await context.send("No suggestions found for this month.")
+        if server:
+            suggestions = server['months'].get(month)
+            if not suggestions:
+                await self.bot.outbox.send(context, "No suggestions found for this month.")
             else:
-                suggestions = result[0]['months'][month]
                 if user_id in suggestions:
-                    for suggestion in suggestions[user_id]:
-                        user = await self.bot.fetch_user(int(user_id))
-                        embed = get_embed_from_suggestion(suggestion, user.name)
-                        await context.send(embed=embed)
+                    await self.send_pages(context, context.guild, month, user_id, context.author.id)
                 else:
                     if user_id == str(context.author.id):
-                        await context.send("You haven't made any suggestions this month.")
+                        await self.bot.outbox.send(context, "You haven't made any suggestions this month.")
                     else:
-                        await context.send("This user hasn't made any suggestions this month.")
+                        await self.bot.outbox.send(context, "This user hasn't made any suggestions this month.")
         else:
-            await context.send("Server not found.")
+            await self.bot.outbox.send(context, "Server not found.")
 
     @commands.hybrid_command(
         name="rs",
@@ -103,37 +104,20 @@ class Suggestions(commands.Cog, name="suggestions"):
     )
     async def rs(self, context: Context, uuid=None) -> None:
         if not uuid:
-            await context.send("Please provide the suggestion UUID.")
+            await self.bot.outbox.send(context, "Please provide the suggestion UUID.")
             return
 
-        server = Query()
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(None, self.database.search, server.server_id == context.guild.id)
-
-        if not result:
-            await context.send("Server not found.")
+        if not await self.database.get(context.guild.id):
+            await self.bot.outbox.send(context, "Server not found.")
             return
 
         user_id = str(context.author.id)
-        for month_key, month_data in result[0]['months'].items():
-            suggestions = month_data.get(user_id)
-            if suggestions:
-                for suggestion in suggestions:
-                    if suggestion['id'] == uuid:
-                        suggestions.remove(suggestion)
-
-                        if len(suggestions) == 0:
-                            result[0]['months'][month_key].pop(user_id, None)
-                        if len(result[0]['months'][month_key]) == 0:
-                            result[0]['months'].pop(month_key, None)
-
-                        await loop.run_in_executor(None, self.database.update, {
-                            'months': result[0]['months']
-                        }, server.server_id == context.guild.id)
-                        await context.send("Suggestion removed.")
-                        return
-
-        await context.send("Suggestion not found / Insufficient permissions.")
+        if await self.database.remove_suggestion(context.guild.id, user_id, uuid):
+            self.bot.embeds.invalidate(uuid)
+            await self.bot.outbox.send(context, "Suggestion removed.")
+            return
+
+        await self.bot.outbox.send(context, "Suggestion not found / Insufficient permissions.")
 
     @commands.hybrid_command(
         name="month",
@@ -147,52 +131,208 @@ class Suggestions(commands.Cog, name="suggestions"):
         elif re.match(r"\d{2}/\d{2}", arg):
             month = arg
         else:
-            await context.send("Invalid argument.")
+            await self.bot.outbox.send(context, "Invalid argument.")
             return
 
-        server = Query()
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(None, self.database.search, server.server_id == context.guild.id)
-
-        if not result:
-            await context.send("Server not found in the database.")
+        server = await self.database.get(context.guild.id)
+        if not server:
+            await self.bot.outbox.send(context, "Server not found in the database.")
             return
 
-        if month not in result[0]['months']:
-            await context.send("No suggestions found for this month.")
+        suggestions = server['months'].get(month)
+        if not suggestions:
+            await self.bot.outbox.send(context, "No suggestions found for this month.")
             return
 
-        await context.send("Suggestions sent to your DMs.")
+        await self.bot.outbox.send(context, "Suggestions sent to your DMs.")
+        await self.send_pages(context.author, context.guild, month, priority=BULK)
 
-        for user in result[0]['months'][month]:
-            for suggestion in result[0]['months'][month][user]:
-                user_obj = await self.bot.fetch_user(int(user))
-                embed = get_embed_from_suggestion(suggestion, user_obj.name)
-                await context.author.send(embed=embed)
+    async def send_pages(self, destination, guild, month: str, user_id: str = None, owner_id: int = None,
+                         priority: int = INTERACTIVE) -> None:
+        """
+        Sends the first page of a month's suggestions (or of a user's suggestions of the month) with buttons to turn
+        pages. Only the page shown is read and rendered.
+        """
+        view = SuggestionPaginator(self.bot, guild, month, user_id, owner_id)
+        content, embeds = await view.render()
+        view.message = await self.bot.outbox.send(destination, content, priority=priority, embeds=embeds, view=view)
+
+    def get_scan_limit(self, server: dict) -> int:
+        default = self.bot.config.get("scan_limit", SCAN_LIMIT)
+        return server.get('settings', {}).get('scan_limit', default)
 
     @commands.hybrid_command(
         name="scan",
         description="Scans the last N messages in the channel for suggestions. "
+                    "Use --since-checkpoint to only scan the messages after the last scan. "
                     "Example: !scan 06/24 100",
     )
-    async def scan(self, context: Context, month, limit: int = None) -> None:
+    async def scan(self, context: Context, month, arg1=None, arg2=None) -> None:
         if not re.match(r"\d{2}/\d{2}", month):
-            await context.send("Please provide a valid month (MM/YY).")
+            await self.bot.outbox.send(context, "Please provide a valid month (MM/YY).")
             return
 
-        limit = min(limit, SCAN_LIMIT) if limit else SCAN_LIMIT
-        channel = context.channel
-        count = 0
+        limit = None
+        since_checkpoint = False
+        for arg in (arg1, arg2):
+            if arg is None:
+                continue
+            if arg == "--since-checkpoint":
+                since_checkpoint = True
+            elif arg.isdigit():
+                limit = int(arg)
+            else:
+                await self.bot.outbox.send(context, "Invalid arguments.")
+                return
+
+        server = await self.database.get(context.guild.id, context.guild.name)
+        budget = self.get_scan_limit(server)
+        limit = min(limit, budget) if limit else budget
+
+        channel_id = str(context.channel.id)
+        checkpoint = dict(server.get('checkpoints', {}).get(channel_id, {}))
+        state = checkpoint.get('scan')
+
+        if since_checkpoint:
+            if not checkpoint.get('message_id'):
+                await self.bot.outbox.send(context, "This channel has no checkpoint yet, run a full scan first.")
+                return
+            history = context.channel.history(
+                limit=limit, after=discord.Object(id=checkpoint['message_id']), oldest_first=True
+            )
+            progress = await self.bot.outbox.send(
+                context, f"Scanning up to {limit} messages since the last checkpoint..."
+            )
+
+            def next_checkpoint(page: list) -> tuple:
+                checkpoint['message_id'] = page[-1].id
+                checkpoint['month'] = month
+                return channel_id, dict(checkpoint)
 
-        async for message in channel.history(limit=limit):
-            message_content = clean_string_before_parsing(message.content).lower()
-            result = parser.parse(message_content)
+        else:
+            if state and state['month'] == month and state['remaining'] > 0:
+                # A scan of this channel was interrupted, continue after the last page it committed
+                before = discord.Object(id=state['before']) if state['before'] else None
+                limit = state['remaining']
+                history = context.channel.history(limit=limit, before=before)
+                progress = await self.bot.outbox.send(
+                    context, f"Resuming the interrupted scan, {limit} messages left..."
+                )
+            else:
+                state = {'month': month, 'newest': None, 'before': None, 'remaining': limit}
+                history = context.channel.history(limit=limit)
+                progress = await self.bot.outbox.send(context, f"Scanning the last {limit} messages...")
+
+            def next_checkpoint(page: list) -> tuple:
+                state['newest'] = state['newest'] or page[0].id
+                state['before'] = page[-1].id
+                state['remaining'] -= len(page)
+                checkpoint['scan'] = dict(state)
+                return channel_id, dict(checkpoint)
+
+        scanned, count, failed = await self.scan_history(context, history, month, limit, progress, next_checkpoint)
+
+        if not since_checkpoint:
+            # Finished, the newest message of the scan becomes the channel's watermark
+            if state['newest'] and state['newest'] > (checkpoint.get('message_id') or 0):
+                checkpoint['message_id'] = state['newest']
+                checkpoint['month'] = month
+            checkpoint['scan'] = None
+            await self.database.add_batch(context.guild.id, [], (channel_id, checkpoint))
+
+        await progress.edit(content=f"Scanned {scanned} messages.")
+        report = f"Added {count} suggestions to the database."
+        if failed:
+            report += f" {failed} messages couldn't be parsed, they are in the logs."
+        await self.bot.outbox.send(context, report)
+
+    async def scan_history(self, context: Context, history, month: str, limit: int, progress,
+                           next_checkpoint) -> tuple[int, int, int]:
+        """
+        Reads the history in pages. Each page is parsed on the parsing pool while the next one is being read, then
+        its suggestions and the checkpoint returned by next_checkpoint(page) are committed in one storage
+        transaction. Pages are committed in order, so the checkpoint always matches what is stored.
+        Returns the number of messages read, of suggestions added and of messages that failed to parse.
+        """
+        committed = None
+        page = []
+        scanned = 0
+        last_update = time.monotonic()
+        try:
+            async for message in history:
+                page.append(message)
+                scanned += 1
+                if len(page) == SCAN_PAGE_SIZE:
+                    committed = asyncio.create_task(
+                        self.commit_page(context.guild.id, page, month, committed, next_checkpoint)
+                    )
+                    page = []
+                if time.monotonic() - last_update >= PROGRESS_INTERVAL:
+                    last_update = time.monotonic()
+                    await progress.edit(content=f"Scanning... {scanned}/{limit} messages read.")
+        except Exception:
+            # Keep the pages that were read in full, the next scan resumes after them
+            if committed is not None:
+                await committed
+            raise
+        if page:
+            committed = asyncio.create_task(
+                self.commit_page(context.guild.id, page, month, committed, next_checkpoint)
+            )
+        count, failed = await committed if committed is not None else (0, 0)
+        return scanned, count, failed
+
+    async def commit_page(self, server_id: int, page: list, month: str, previous: asyncio.Task | None,
+                          next_checkpoint) -> tuple[int, int]:
+        """Returns the suggestions added and the messages that failed to parse, this page's and the previous ones'."""
+        # Messages that were already ingested with the same content are not parsed again
+        tasks = []
+        for message in page:
+            if not self.bot.prefilter.check(message.content):
+                continue
+            message_hash = content_hash(message.content)
+            if self.database.is_ingested(server_id, str(message.id), message_hash):
+                continue
+            # A scan's parses are bounded by its scan limit, they wait for the pool instead of being shed
+            parse = self.bot.parsing.parse(message.content, shed=False)
+            tasks.append((message, message_hash, asyncio.create_task(parse)))
+        results = await asyncio.gather(*(task for _, _, task in tasks), return_exceptions=True)
+
+        entries = []
+        failed = 0
+        for (message, message_hash, _), result in zip(tasks, results):
+            if isinstance(result, Exception):
+                failed += 1
+                self.bot.logger.error(f"Failed to parse message {message.id} during a scan", exc_info=result)
+                continue
             if result is None:
                 continue
-            await self.bot.add_result_to_db(message, result, month=month)
-            count += 1
+            entries.append((str(message.id), message_hash, month, str(message.author.id),
+                            self.bot.make_suggestions(result)))
+
+        count, previous_failed = await previous if previous is not None else (0, 0)
+        count += await self.database.add_batch(server_id, entries, next_checkpoint(page))
+        return count, previous_failed + failed
+
+    @commands.hybrid_command(
+        name="scanlimit",
+        description="Shows or sets the maximum number of messages a scan can read in this server. "
+                    "Example: !scanlimit 5000",
+    )
+    @commands.has_permissions(manage_guild=True)
+    async def scanlimit(self, context: Context, limit: int = None) -> None:
+        server = await self.database.get(context.guild.id, context.guild.name)
+        if limit is None:
+            await self.bot.outbox.send(context, f"Scans can read up to {self.get_scan_limit(server)} messages.")
+            return
+
+        max_limit = self.bot.config.get("max_scan_limit", MAX_SCAN_LIMIT)
+        if not 1 <= limit <= max_limit:
+            await self.bot.outbox.send(context, f"The limit must be between 1 and {max_limit}.")
+            return
 
-        await context.send(f"Added {count} suggestions to the database.")
+        await self.database.set_settings(context.guild.id, scan_limit=limit)
+        await self.bot.outbox.send(context, f"Scans can now read up to {limit} messages.")
 
 
 async def setup(bot, database) -> None:
@@ -0,0 +1,92 @@
+class SuggestionIndex:
+    """
+    In-memory indexes over the cached guild documents.
+
+    - servers: server_id -> guild document
+    - suggestions: suggestion UUID -> (server_id, month, user_id, position in the user's list)
+
+    Every lookup is a dict access. Removing a suggestion only renumbers the rest of that user's list for that month.
+    """
+
+    def __init__(self) -> None:
+        self.servers: dict[int, dict] = {}
+        self.missing: set[int] = set()
+        self.suggestions: dict[str, tuple[int, str, str, int]] = {}
+
+    def has_server(self, server_id: int) -> bool:
+        return server_id in self.servers
+
+    def add_server(self, server: dict) -> dict:
+        """Registers a guild document and indexes all its suggestions. Returns the registered document."""
+        server_id = server['server_id']
+        if server_id in self.servers:
+            return self.servers[server_id]
+        self.servers[server_id] = server
+        self.missing.discard(server_id)
+        for month, users in server['months'].items():
+            for user_id, suggestions in users.items():
+                self._index_list(server_id, month, user_id, suggestions, 0)
+        return server
+
+    def add_suggestions(self, server_id: int, month: str, user_id: str, suggestions: list) -> None:
+        """Appends suggestions to a user's list of the month and indexes them."""
+        users = self.servers[server_id]['months'].setdefault(month, {})
+        user_suggestions = users.setdefault(user_id, [])
+        start = len(user_suggestions)
+        user_suggestions.extend(suggestions)
+        self._index_list(server_id, month, user_id, user_suggestions, start)
+
+    def locate(self, suggestion_id: str) -> tuple[int, str, str, int] | None:
+        return self.suggestions.get(suggestion_id)
+
+    def get_suggestion(self, suggestion_id: str) -> dict | None:
+        location = self.suggestions.get(suggestion_id)
+        if location is None:
+            return None
+        server_id, month, user_id, position = location
+        return self.servers[server_id]['months'][month][user_id][position]
+
+    def replace_suggestion(self, suggestion: dict) -> None:
+        """Replaces a suggestion, in place, by one with the same id."""
+        server_id, month, user_id, position = self.suggestions[suggestion['id']]
+        self.servers[server_id]['months'][month][user_id][position] = suggestion
+
+    def remove_suggestion(self, suggestion_id: str) -> dict | None:
+        """Removes a suggestion from its guild document. Returns the removed suggestion, or None if unknown."""
+        location = self.suggestions.pop(suggestion_id, None)
+        if location is None:
+            return None
+        server_id, month, user_id, position = location
+        months = self.servers[server_id]['months']
+        user_suggestions = months[month][user_id]
+        suggestion = user_suggestions.pop(position)
+        self._index_list(server_id, month, user_id, user_suggestions, position)
+
+        if len(user_suggestions) == 0:
+            months[month].pop(user_id, None)
+        if len(months[month]) == 0:
+            months.pop(month, None)
+        return suggestion
+
+    def get_page(self, server_id: int, month: str, offset: int, size: int,
+                 user_id: str = None) -> tuple[list[tuple[str, dict]], int]:
+        """
+        Returns up to `size` (user_id, suggestion) pairs of a month starting at `offset`, in the order they are shown
+        by .month, and how many suggestions the month has. Only the suggestions of `user_id` if it is given.
+        Costs O(users + size), the users before the offset are skipped by the length of their lists.
+        """
+        users = self.servers[server_id]['months'].get(month, {})
+        if user_id is not None:
+            users = {user_id: users[user_id]} if user_id in users else {}
+        page, total = [], 0
+        for user, suggestions in users.items():
+            start = max(offset - total, 0)
+            end = min(offset + size - total, len(suggestions))
+            if start < end:
+                page.extend((user, suggestion) for suggestion in suggestions[start:end])
+            total += len(suggestions)
+        return page, total
+
+    def _index_list(self, server_id: int, month: str, user_id: str, suggestions: list, start: int) -> None:
+        for position in range(start, len(suggestions)):
+            self.suggestions[suggestions[position]['id']] = (server_id, month, user_id, position)
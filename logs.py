@@ -0,0 +1,60 @@
+import gzip
+import logging
+import os
+import queue
+import shutil
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from utils import LoggingFormatter, JsonFormatter
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler for a listener in the same process. Only the message is merged on the calling thread, tracebacks
+    are formatted by the listener's handlers.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def compress_rotated(source: str, dest: str) -> None:
+    with open(source, 'rb') as log, gzip.open(dest, 'wb') as compressed:
+        shutil.copyfileobj(log, compressed)
+    os.remove(source)
+
+
+def setup_logging(logger: logging.Logger, config: dict) -> QueueListener:
+    """
+    Logs to the console and to a file that is rotated by size, with the rotated files compressed with gzip. The
+    logger only puts records in a queue, the handlers run on the thread of the returned listener, so the event loop
+    never waits on the terminal or the disk. The listener is already started, stop it on shutdown to flush it.
+
+    Config: log_level, log_file, log_max_bytes, log_backups and log_json (the file gets one JSON object per line).
+    """
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(LoggingFormatter())
+
+    file_handler = RotatingFileHandler(
+        filename=config.get("log_file", "bot.log"),
+        maxBytes=config.get("log_max_bytes", 5 * 1024 * 1024),
+        backupCount=config.get("log_backups", 5),
+        encoding='utf-8',
+    )
+    file_handler.namer = lambda name: name + '.gz'
+    file_handler.rotator = compress_rotated
+    if config.get("log_json", False):
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(
+            "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
+        ))
+
+    records = queue.SimpleQueue()
+    logger.setLevel(config.get("log_level", "INFO"))
+    logger.addHandler(LocalQueueHandler(records))
+    listener = QueueListener(records, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+    return listener
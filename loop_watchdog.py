@@ -0,0 +1,161 @@
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from metrics import registry
+
+LOOP_LAG_SECONDS = registry.histogram('bot_event_loop_lag_seconds', "How late the event loop ran the watchdog's timer.")
+LOOP_STALLS = registry.counter(
+    'bot_event_loop_stalls_total', "Times the event loop was blocked past the watchdog threshold.", 'handler'
+)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ASYNCIO = os.path.dirname(asyncio.__file__)
+
+
+def _short_path(filename: str) -> str:
+    # Relative to the bot for its own files, the package and module for libraries
+    if filename.startswith(ROOT):
+        return os.path.relpath(filename, ROOT)
+    return os.path.join(*filename.split(os.sep)[-2:])
+
+
+class LoopWatchdog:
+    """
+    Measures the scheduling lag of the event loop: a task sleeps `interval` seconds at a time, how late it wakes up is
+    how long the loop was busy with something else. A thread watches the task's heartbeat, and when the loop hasn't
+    run it for half of `threshold` it captures the stack of the loop's thread, i.e. of the handler blocking it.
+    Lags of `threshold` or more are stalls, logged with that stack and kept (the last `keep` ones) for .botinfo.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, keep: int = 20,
+                 logger: logging.Logger = None) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.logger = logger or logging.getLogger('bot')
+        self.stalls = collections.deque(maxlen=keep)
+        self.stall_count = 0
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        # (heartbeat, stall) captured by the thread while the loop was blocked since that heartbeat
+        self._capture = None
+        self._loop_thread = None
+        self._loop = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Starts watching the running loop, from its thread."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def _measure(self) -> None:
+        while True:
+            start = self._heartbeat
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            capture, self._capture = self._capture, None
+            self._heartbeat = now
+            lag = max(0.0, now - start - self.interval)
+            LOOP_LAG_SECONDS.observe(lag)
+            self.samples += 1
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self._record(lag, capture[1] if capture is not None and capture[0] == start else None)
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(min(self.interval, self.threshold / 4)):
+            heartbeat = self._heartbeat
+            if self._capture is not None and self._capture[0] == heartbeat:
+                continue
+            if time.monotonic() - heartbeat >= self.interval + self.threshold / 2:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._capture = heartbeat, self._describe(frame)
+
+    def _describe(self, frame) -> dict:
+        """What the loop is running: the task, the first frame of the bot's code in it (the handler) and the stack."""
+        stack = traceback.extract_stack(frame)
+        # Frames after the last asyncio one are the callback or task step being run
+        start = max((index for index, summary in enumerate(stack) if summary.filename.startswith(ASYNCIO)),
+                    default=-1) + 1
+        running = stack[start:] or stack
+        own = [summary for summary in running if summary.filename.startswith(ROOT)]
+        handler = (own or running)[0]
+        task = asyncio.current_task(self._loop)
+        return {
+            'handler': f"{_short_path(handler.filename)}:{handler.name}",
+            'where': f"{_short_path(running[-1].filename)}:{running[-1].lineno} in {running[-1].name}",
+            'task': task.get_name() if task is not None else None,
+            'stack': ''.join(traceback.format_list(running)),
+        }
+
+    def _record(self, lag: float, capture: dict = None) -> None:
+        # A stall shorter than the thread's period can end before its stack is captured
+        stall = {'time': time.time(), 'lag': lag, 'handler': 'unknown', 'where': None, 'task': None, 'stack': None}
+        stall.update(capture or {})
+        self.stalls.append(stall)
+        self.stall_count += 1
+        LOOP_STALLS.inc(stall['handler'])
+        task = f" (task {stall['task']})" if stall['task'] else ''
+        stack = f", stack:\n{stall['stack']}" if stall['stack'] else ''
+        self.logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms by {stall['handler']}{task}{stack}")
+
+    def stats(self) -> dict:
+        return {
+            'samples': self.samples,
+            'last_lag': self.last_lag,
+            'p99_lag': LOOP_LAG_SECONDS.quantile(0.99) if self.samples else 0.0,
+            'max_lag': self.max_lag,
+            'stalls': self.stall_count,
+            'last_stall': self.stalls[-1] if self.stalls else None,
+        }
+
+    async def close(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+# Testing
+if __name__ == '__main__':
+    def parse_everything() -> None:
+        deadline = time.monotonic() + 0.4
+        while time.monotonic() < deadline:
+            pass
+
+    async def busy_handler() -> None:
+        parse_everything()
+
+    async def test() -> None:
+        logging.basicConfig(level=logging.INFO)
+        watchdog = LoopWatchdog()
+        watchdog.start()
+        await asyncio.sleep(0.3)
+        await asyncio.create_task(busy_handler(), name='busy')
+        await asyncio.sleep(0.3)
+        await watchdog.close()
+        print(watchdog.stats())
+
+    asyncio.run(test())
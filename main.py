@@ -1,5 +1,7 @@
 import os
 import sys
+import asyncio
+import importlib
 import json
 import random
 import discord
@@ -7,17 +9,23 @@ import logging
 import platform
 import uuid
 
-from suggestion_yacc import parser
 from dotenv import load_dotenv
 
 from discord.ext import commands, tasks
 from discord.ext.commands import Context
 
-import asyncio
-from tinydb import TinyDB, Query
+from cache import GuildCache
+from logs import setup_logging
+from loop_watchdog import LoopWatchdog
+from metrics import registry, start_exporter
+from names import UserNameResolver
+from outbox import SendScheduler
+from parsing import ParseQueueFull, ParsingService, content_hash
+from prefilter import SuggestionPreFilter
+from recorder import EventRecorder
+from storage import create_storage
 
-from utils import (LoggingFormatter, get_embed_from_suggestion, next_month_year, clean_string_before_parsing,
-                   clean_text_after_parsing)
+from utils import EmbedCache, next_month_year, clean_text_after_parsing
 
 """CONFIG"""
 
@@ -32,23 +40,16 @@ intents.message_content = True
 
 """LOGGER"""
 
+# Console and rotated file output, written by a listener thread
 logger = logging.getLogger('bot')
-logger.setLevel(logging.INFO)
+log_listener = setup_logging(logger, config)
 
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(LoggingFormatter())
+"""METRICS"""
 
-# File handler
-file_handler = logging.FileHandler(filename='bot.log', encoding='utf-8', mode='w')
-file_handler_formatter = logging.Formatter(
-    "[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", style="{"
+MESSAGES = registry.counter('bot_messages_total', "Messages seen by on_message, by outcome.", 'outcome')
+MESSAGE_STAGE_SECONDS = registry.histogram(
+    'bot_message_stage_seconds', "Time spent in each stage of on_message.", 'stage'
 )
-file_handler.setFormatter(file_handler_formatter)
-
-# Add handlers
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
 
 
 class DiscordBot(commands.Bot):
@@ -60,24 +61,68 @@ class DiscordBot(commands.Bot):
         )
         self.logger = logger
         self.config = config
-        self.database = TinyDB("db.json")
+        self.database = GuildCache(create_storage(config), flush_threshold=config.get("flush_threshold", 50))
+        self.prefilter = SuggestionPreFilter()
+        self.embeds = EmbedCache(config.get("embed_cache_size", 2048))
+        self.outbox = SendScheduler(max_bulk=config.get("bulk_send_concurrency", 4))
+        self.user_names = UserNameResolver(self, self.database, ttl=config.get("user_name_ttl", 24 * 60 * 60))
+        self.parsing = ParsingService(
+            workers=config.get("parser_workers", 2),
+            max_pending=config.get("parser_max_pending", 100),
+            max_queued=config.get("parser_max_queued", 1000),
+            mode=config.get("parser_mode", "thread"),
+            engine=config.get("lexer", "ply"),
+            cache_bytes=config.get("parse_cache_bytes", 8 * 1024 * 1024),
+        )
+        self.metrics_runner = None
+        self.watchdog = LoopWatchdog(
+            interval=config.get("watchdog_interval", 0.1),
+            threshold=config.get("watchdog_threshold", 0.25),
+            logger=self.logger,
+        )
+        # Opt-in record of the incoming traffic, for benchmarks/replay.py
+        self.recorder = EventRecorder(
+            config["record_file"], config["prefix"], anonymize=config.get("record_anonymize", False),
+            key=config.get("record_anonymize_key"),
+        ) if config.get("record_file") else None
+        self.register_gauges()
+
+    def register_gauges(self) -> None:
+        def hit_ratio(stats: dict) -> float:
+            lookups = stats['hits'] + stats['misses']
+            return stats['hits'] / lookups if lookups else 0.0
+
+        registry.gauge('bot_cache_hit_ratio', "Hit ratio of the in-memory caches.", lambda: {
+            'parse': hit_ratio(self.parsing.cache.stats()),
+            'embed': hit_ratio(self.embeds.stats()),
+            'user_names': self.user_names.stats()['hit_rate'],
+        }, 'cache')
+        registry.gauge('bot_cached_guilds', "Guilds loaded in the guild cache.",
+                       lambda: len(self.database.index.servers))
+        registry.gauge('bot_pending_writes', "Changes waiting for the next flush.", lambda: len(self.database.pending))
+        registry.gauge('bot_send_queue_depth', "Messages waiting in the outbox.", lambda: self.outbox.depth())
+        registry.gauge('bot_parse_queue', "Messages waiting for or being parsed.",
+                       lambda: {'waiting': self.parsing.waiting, 'running': self.parsing.running}, 'state')
 
     async def load_cogs(self) -> None:
-        for f in os.listdir(f"{os.path.realpath(os.path.dirname(__file__))}/cogs"):
-            if f.endswith(".py"):
-                extension = f[:-3]
-                try:
-                    await self.load_extension_with_db(f"cogs.{extension}")
-                    self.logger.info(f"Loaded extension '{extension}'")
-                except Exception as e:
-                    exception = f"{type(e).__name__}: {e}"
-                    self.logger.error(
-                        f"Failed to load extension {extension}\n{exception}"
-                    )
-
-    async def load_extension_with_db(self, name: str) -> None:
-        module = __import__(name, fromlist=['setup'])
-        await module.setup(self, self.database)
+        # The cogs are imported together on worker threads, keeping the loop free, then set up in name order
+        extensions = sorted(f[:-3] for f in os.listdir(f"{os.path.realpath(os.path.dirname(__file__))}/cogs")
+                            if f.endswith(".py"))
+        modules = await asyncio.gather(
+            *(asyncio.to_thread(importlib.import_module, f"cogs.{extension}") for extension in extensions),
+            return_exceptions=True,
+        )
+        for extension, module in zip(extensions, modules):
+            try:
+                if isinstance(module, BaseException):
+                    raise module
+                await module.setup(self, self.database)
+                self.logger.info(f"Loaded extension '{extension}'")
+            except Exception as e:
+                exception = f"{type(e).__name__}: {e}"
+                self.logger.error(
+                    f"Failed to load extension {extension}\n{exception}"
+                )
 
     @tasks.loop(minutes=1.0)
     async def status_task(self) -> None:
@@ -94,6 +139,10 @@ class DiscordBot(commands.Bot):
     async def before_status_task(self) -> None:
         await self.wait_until_ready()
 
+    @tasks.loop(seconds=30.0)
+    async def flush_task(self) -> None:
+        await self.database.flush()
+
     async def setup_hook(self) -> None:
         self.logger.info(f"Logged in as {self.user.name}")
         self.logger.info(f"discord.py API version: {discord.__version__}")
@@ -102,84 +151,145 @@ class DiscordBot(commands.Bot):
             f"Running on: {platform.system()} {platform.release()} ({os.name})"
         )
         self.logger.info("-------------------")
+        self.watchdog.start()
         await self.load_cogs()
         self.status_task.start()
+        self.flush_task.change_interval(seconds=config.get("flush_interval", 30.0))
+        self.flush_task.start()
+        if config.get("metrics_port"):
+            self.metrics_runner = await start_exporter(config["metrics_port"], config.get("metrics_host", "127.0.0.1"))
+            self.logger.info(f"Serving metrics on port {config['metrics_port']}")
+
+    async def close(self) -> None:
+        self.flush_task.cancel()
+        await self.watchdog.close()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await self.outbox.close()
+        await self.database.close()
+        self.parsing.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        await super().close()
+
+    async def on_interaction(self, interaction: discord.Interaction) -> None:
+        if self.recorder is not None:
+            self.recorder.record_interaction(interaction)
 
     async def on_message(self, message: discord.Message) -> None:
-        if message.author == self.user or message.author.bot:
+        if message.author == self.user:
+            return
+        if self.recorder is not None:
+            self.recorder.record_message(message)
+        if message.author.bot:
             return
         if message.content.startswith(config["prefix"]):
+            MESSAGES.inc('command')
             await self.process_commands(message)
-        else:
-            try:
-                message_content = clean_string_before_parsing(message.content).lower()
-                result = parser.parse(message_content)
-                if result is None:
-                    return
-                suggestions = await self.add_result_to_db(message, result)
-                print(suggestions)
-                for suggestion in suggestions:
-                    embed = get_embed_from_suggestion(suggestion, message.author.name)
-                    await message.channel.send(embed=embed)
-            except Exception as e:
-                pass
-
-    async def add_server_if_not_exists(self, server_id: int, server_name: str) -> None:
-        server = Query()
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(None, self.database.search, server.server_id == server_id)
-        if not result:
-            await loop.run_in_executor(None, self.database.insert, {
-                'server_id': server_id,
-                'server_name': server_name,
-                'months': {},
-            })
-            self.logger.info(f"Added server {server_name} to the database.")
-        else:
-            self.logger.info(f"Server {server_name} already exists in the database.")
+            return
+        # Suggestions are only taken from guild channels
+        if message.guild is None:
+            return
 
-    async def add_result_to_db(self, message: discord.Message, result: list, month=None) -> list | None:
-        await self.add_server_if_not_exists(message.guild.id, message.guild.name)
+        with MESSAGE_STAGE_SECONDS.time('prefilter'):
+            candidate = self.prefilter.check(message.content)
+        if not candidate:
+            MESSAGES.inc('skipped')
+            return
+        try:
+            await self.database.get(message.guild.id, message.guild.name)
+            if self.database.is_ingested(message.guild.id, str(message.id), content_hash(message.content)):
+                MESSAGES.inc('duplicate')
+                return
+            with MESSAGE_STAGE_SECONDS.time('parse'):
+                result = await self.parsing.parse(message.content)
+            if result is None:
+                MESSAGES.inc('no_suggestion')
+                return
+            with MESSAGE_STAGE_SECONDS.time('db'):
+                suggestions = await self.add_result_to_db(message, result)
+            self.logger.debug(f"Added {len(suggestions)} suggestions from message {message.id}: {suggestions}")
+            MESSAGES.inc('suggestion')
+            embeds = [self.embeds.render(suggestion, message.author.name) for suggestion in suggestions]
+            if embeds:
+                with MESSAGE_STAGE_SECONDS.time('send'):
+                    sent = await self.outbox.send_embeds(message.channel, embeds)
+                self.logger.debug(f"Sent {len(embeds)} suggestions in {sent} messages, "
+                                  f"{len(embeds) - sent} API calls saved.")
+        except ParseQueueFull as e:
+            # A burst the parsing pool can't keep up with, the message is dropped rather than queued without bound
+            MESSAGES.inc('shed')
+            self.logger.debug(f"Shed message {message.id}: {e}")
+        except Exception:
+            MESSAGES.inc('error')
+            self.logger.exception(f"Failed to handle message {message.id} in channel {message.channel.id}")
+
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+        # Updates without content (e.g. link previews) and messages no suggestion was taken from are ignored
+        content = payload.data.get('content')
+        if payload.guild_id is None or content is None:
+            return
+        server = await self.database.get(payload.guild_id)
+        message_id = str(payload.message_id)
+        if server is None or message_id not in server.get('messages', {}):
+            return
+        message_hash = content_hash(content)
+        if self.database.is_ingested(payload.guild_id, message_id, message_hash):
+            return
 
-        server = Query()
-        loop = asyncio.get_running_loop()
-        result_db = await loop.run_in_executor(None, self.database.search, server.server_id == message.guild.id)
+        # Edits are rare and skipping one would leave stale suggestions behind, they wait for the pool
+        result = await self.parsing.parse(content, shed=False) if self.prefilter.check(content) else None
+        suggestions = self.make_suggestions(result) if result else []
+        user_id = str(payload.data['author']['id'])
+        changes = await self.database.revise(payload.guild_id, message_id, message_hash, user_id, suggestions)
+        if changes:
+            for suggestion in changes['updated'] + changes['removed']:
+                self.embeds.invalidate(suggestion['id'])
+            self.logger.info(
+                f"Message {message_id} was edited: {len(changes['updated'])} suggestions updated, "
+                f"{len(changes['added'])} added and {len(changes['removed'])} removed."
+            )
 
-        if not result_db:  # impossible
-            self.logger.error(f"Server {message.guild.name} not found in the database.")
-            return None
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent) -> None:
+        await self.forget_messages(payload.guild_id, [payload.message_id])
 
-        user_id = str(message.author.id)
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent) -> None:
+        await self.forget_messages(payload.guild_id, payload.message_ids)
 
-        chosen_month = next_month_year() if not month else month
-        months = result_db[0]['months']
-
-        if months.get(chosen_month) is None:
-            months[chosen_month] = {}
-            months[chosen_month][user_id] = []
-        elif months[chosen_month].get(user_id) is None:
-            months[chosen_month][user_id] = []
-
-        suggestions = []
-        for item in result:
-            obj = {}
-            for key, value in item:
-                if isinstance(value, list):
-                    obj[key] = ' '.join(value)
-                else:
-                    obj[key] = value
-            if obj != {}:
-                suggestions.append(obj)
+    async def forget_messages(self, guild_id: int | None, message_ids) -> None:
+        if guild_id is None or await self.database.get(guild_id) is None:
+            return
+        for message_id in message_ids:
+            removed = await self.database.forget(guild_id, str(message_id))
+            for suggestion in removed:
+                self.embeds.invalidate(suggestion['id'])
+            if removed:
+                self.logger.info(f"Message {message_id} was deleted: {len(removed)} suggestions removed.")
+
+    @staticmethod
+    def make_suggestions(result: tuple) -> list:
+        # Each parsed suggestion is a sequence of (field, text) pairs
+        suggestions = [dict(item) for item in result if item]
 
         for s in suggestions:
             s['id'] = str(uuid.uuid4())
             if 'description' in s:
                 s['description'] = clean_text_after_parsing(s['description'])
-            months[chosen_month][user_id].append(s)
+        return suggestions
+
+    async def add_result_to_db(self, message: discord.Message, result: tuple, month=None) -> list | None:
+        await self.database.get(message.guild.id, message.guild.name)
+
+        user_id = str(message.author.id)
+        chosen_month = next_month_year() if not month else month
+        suggestions = self.make_suggestions(result)
 
-        await loop.run_in_executor(
-            None, self.database.update, {'months': months}, server.server_id == message.guild.id
+        status = await self.database.ingest(
+            message.guild.id, str(message.id), content_hash(message.content), chosen_month, user_id, suggestions
         )
+        # Already ingested with the same content (e.g. by .scan), nothing new to show
+        if status == 'unchanged':
+            return []
         return suggestions
 
     async def on_command_completion(self, context: Context) -> None:
@@ -251,3 +361,4 @@ if __name__ == '__main__':
     load_dotenv()
     bot = DiscordBot()
     bot.run(os.getenv("TOKEN"))
+    log_listener.stop()
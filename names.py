@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+from cache import GuildCache
+
+
+class UserNameResolver:
+    """
+    Resolves user ids to the names shown in the suggestion embeds.
+
+    A name is looked up in the guild's member cache first, then in a TTL cache of fetched names that is persisted in
+    the storage, and only then fetched from the API. Misses of a lookup are fetched concurrently, at most
+    `max_fetches` at a time, and concurrent lookups of the same user share a single request.
+    """
+
+    def __init__(self, bot, database: GuildCache, ttl: float = 24 * 60 * 60, max_fetches: int = 5,
+                 logger: logging.Logger = None) -> None:
+        self.bot = bot
+        self.database = database
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger('bot')
+        self.names: dict[str, tuple[str, float]] = {}
+        self._loaded = False
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._fetches = asyncio.Semaphore(max_fetches)
+        self.lookups = 0
+        self.member_hits = 0
+        self.cache_hits = 0
+        self.fetches = 0
+        self.failures = 0
+
+    async def resolve(self, guild: discord.Guild | None, user_ids) -> dict[str, str]:
+        """Returns the name of every user id (str)."""
+        if not self._loaded:
+            self.names = {**await self.database.get_user_names(), **self.names}
+            self._loaded = True
+
+        names, missing = {}, []
+        now = time.time()
+        for user_id in dict.fromkeys(user_ids):
+            self.lookups += 1
+            member = guild.get_member(int(user_id)) if guild is not None else None
+            if member is not None:
+                self.member_hits += 1
+                names[user_id] = member.name
+                continue
+            cached = self.names.get(user_id)
+            if cached is not None and now - cached[1] < self.ttl:
+                self.cache_hits += 1
+                names[user_id] = cached[0]
+                continue
+            missing.append(user_id)
+
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            names.update(zip(missing, fetched))
+            # The names fetched by this lookup are persisted in one write
+            fresh = {user_id: self.names[user_id] for user_id in missing
+                     if user_id in self.names and self.names[user_id][1] >= now}
+            if fresh:
+                await self.database.set_user_names(fresh)
+        return names
+
+    async def _fetch(self, user_id: str) -> str:
+        if user_id in self._inflight:
+            return await asyncio.shield(self._inflight[user_id])
+        future = self._inflight[user_id] = asyncio.get_running_loop().create_future()
+        try:
+            async with self._fetches:
+                self.fetches += 1
+                user = await self.bot.fetch_user(int(user_id))
+        except discord.HTTPException as e:
+            # Deleted accounts and failed requests fall back to the expired name, or to the id
+            self.failures += 1
+            self.logger.warning(f"Failed to fetch user {user_id}\n{type(e).__name__}: {e}")
+            name = self.names[user_id][0] if user_id in self.names else user_id
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieved here so asyncio doesn't warn when nobody else was waiting for it
+            future.exception()
+            raise
+        else:
+            name = user.name
+            self.names[user_id] = (name, time.time())
+        finally:
+            self._inflight.pop(user_id, None)
+        future.set_result(name)
+        return name
+
+    def stats(self) -> dict:
+        hits = self.member_hits + self.cache_hits
+        return {
+            'lookups': self.lookups,
+            'member_hits': self.member_hits,
+            'cache_hits': self.cache_hits,
+            'fetches': self.fetches,
+            'failures': self.failures,
+            'hit_rate': hits / self.lookups if self.lookups else 0.0,
+        }
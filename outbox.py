@@ -0,0 +1,168 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+import discord
+from discord.ext import commands
+
+from utils import pack_embeds
+
+INTERACTIVE = 0
+BULK = 1
+
+
+class SendScheduler:
+    """
+    Central queue of outgoing messages.
+
+    Every channel and every DM has its own bucket, a priority queue drained by its own worker task, so a long dump to
+    one destination doesn't hold back the others and each destination gets one send at a time, in order. Within a
+    bucket INTERACTIVE sends (replies to commands and messages) go before BULK ones (e.g. the pages .month sends to
+    DMs), and sends of the same priority keep their order. Only `max_bulk` BULK sends run at once across all buckets,
+    INTERACTIVE ones never wait for another bucket. A send identical to one still waiting in the same bucket isn't
+    queued twice, both callers get the same message, except replies to a command: each context (and interaction)
+    must get its own.
+    """
+
+    def __init__(self, max_bulk: int = 4, idle_timeout: float = 60.0, logger: logging.Logger = None) -> None:
+        self.idle_timeout = idle_timeout
+        self.logger = logger or logging.getLogger('bot')
+        self.queues: dict[tuple, asyncio.PriorityQueue] = {}
+        self.workers: dict[tuple, asyncio.Task] = {}
+        self.pending: dict[tuple, asyncio.Future] = {}
+        self._order = itertools.count()
+        self._bulk_slots = asyncio.Semaphore(max_bulk)
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    async def send(self, destination, content: str = None, priority: int = INTERACTIVE, **kwargs) -> discord.Message:
+        """Queues `destination.send(content, **kwargs)` (a channel, user or context) and returns the message sent."""
+        if content is not None:
+            kwargs['content'] = content
+        bucket = self._bucket(destination)
+        key = self._key(bucket, kwargs) if not isinstance(destination, commands.Context) else None
+        future = self.pending.get(key) if key is not None else None
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self.pending[key] = future
+        queue = self.queues.get(bucket)
+        if queue is None:
+            queue = self.queues[bucket] = asyncio.PriorityQueue()
+            self.workers[bucket] = asyncio.create_task(self._work(bucket, queue))
+        queue.put_nowait((priority, next(self._order), key, destination, kwargs, future, time.perf_counter()))
+        self.max_depth = max(self.max_depth, self.depth())
+        return await asyncio.shield(future)
+
+    async def send_embeds(self, destination, embeds: list, priority: int = INTERACTIVE) -> int:
+        """Sends embeds packed with pack_embeds. Returns the number of messages sent."""
+        messages = pack_embeds(embeds)
+        for message_embeds in messages:
+            await self.send(destination, priority=priority, embeds=message_embeds)
+        return len(messages)
+
+    @staticmethod
+    def _bucket(destination) -> tuple:
+        if isinstance(destination, commands.Context):
+            destination = destination.channel
+        if isinstance(destination, (discord.User, discord.Member)):
+            return 'dm', destination.id
+        return 'channel', destination.id
+
+    @staticmethod
+    def _key(bucket: tuple, kwargs: dict) -> tuple | None:
+        # Only plain content and embeds can be compared, anything else (files, views...) is always sent
+        if not kwargs.keys() <= {'content', 'embed', 'embeds'}:
+            return None
+        embeds = ([kwargs['embed']] if kwargs.get('embed') else []) + list(kwargs.get('embeds') or [])
+        payload = json.dumps([kwargs.get('content'), [embed.to_dict() for embed in embeds]], sort_keys=True)
+        return bucket, payload
+
+    async def _work(self, bucket: tuple, queue: asyncio.PriorityQueue) -> None:
+        while True:
+            try:
+                priority, _, key, destination, kwargs, future, queued = await asyncio.wait_for(
+                    queue.get(), timeout=self.idle_timeout
+                )
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    self.queues.pop(bucket, None)
+                    self.workers.pop(bucket, None)
+                    return
+                continue
+
+            # Once it is being sent, an identical send is a new message
+            if key is not None and self.pending.get(key) is future:
+                del self.pending[key]
+            bulk = priority == BULK
+            try:
+                if bulk:
+                    await self._bulk_slots.acquire()
+            except asyncio.CancelledError:
+                future.cancel()
+                queue.task_done()
+                raise
+            try:
+                waited = time.perf_counter() - queued
+                self.wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
+                message = await destination.send(**kwargs)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.sent += 1
+                if not future.done():
+                    future.set_result(message)
+            finally:
+                if bulk:
+                    self._bulk_slots.release()
+                queue.task_done()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'buckets': len(self.queues),
+            'sent': self.sent,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'average_wait': self.wait_time / (self.sent + self.failed) if self.sent + self.failed else 0.0,
+            'max_wait': self.max_wait_time,
+        }
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Waits up to `timeout` seconds for the queued sends, then drops the rest."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in list(self.queues.values()))), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Dropped {self.depth()} queued messages on shutdown.")
+        for worker in self.workers.values():
+            worker.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
+        for queue in self.queues.values():
+            while not queue.empty():
+                future = queue.get_nowait()[5]
+                if not future.done():
+                    future.cancel()
+        self.queues.clear()
+        self.workers.clear()
+        self.pending.clear()
@@ -27,38 +27,38 @@ for _k, _v in _lr_goto_items.items():
 del _lr_goto_items
 _lr_productions = [
   ("S' -> All","S'",1,None,None,None),
-  ('All -> Suggestions','All',1,'p_All','suggestion_yacc.py',7),
-  ('All -> Text Suggestions','All',2,'p_All','suggestion_yacc.py',8),
-  ('Suggestions -> Suggestions Suggestion','Suggestions',2,'p_Suggestions','suggestion_yacc.py',17),
-  ('Suggestions -> Suggestion','Suggestions',1,'p_Suggestions','suggestion_yacc.py',18),
-  ('Suggestion -> Title OtherElements','Suggestion',2,'p_Suggestion','suggestion_yacc.py',27),
-  ('OtherElements -> OtherElements OtherElement','OtherElements',2,'p_OtherElements','suggestion_yacc.py',33),
-  ('OtherElements -> <empty>','OtherElements',0,'p_OtherElements','suggestion_yacc.py',34),
-  ('OtherElement -> Author','OtherElement',1,'p_OtherElement','suggestion_yacc.py',43),
-  ('OtherElement -> Description','OtherElement',1,'p_OtherElement','suggestion_yacc.py',44),
-  ('OtherElement -> Genre','OtherElement',1,'p_OtherElement','suggestion_yacc.py',45),
-  ('OtherElement -> Date','OtherElement',1,'p_OtherElement','suggestion_yacc.py',46),
-  ('OtherElement -> Notes','OtherElement',1,'p_OtherElement','suggestion_yacc.py',47),
-  ('OtherElement -> Reviews','OtherElement',1,'p_OtherElement','suggestion_yacc.py',48),
-  ('OtherElement -> Links','OtherElement',1,'p_OtherElement','suggestion_yacc.py',49),
-  ('OtherElement -> Download','OtherElement',1,'p_OtherElement','suggestion_yacc.py',50),
-  ('OtherElement -> Pages','OtherElement',1,'p_OtherElement','suggestion_yacc.py',51),
-  ('OtherElement -> Goodreads','OtherElement',1,'p_OtherElement','suggestion_yacc.py',52),
-  ('OtherElement -> Wikipedia','OtherElement',1,'p_OtherElement','suggestion_yacc.py',53),
-  ('OtherElement -> Quotes','OtherElement',1,'p_OtherElement','suggestion_yacc.py',54),
-  ('Title -> TITLE SEMICOLON Text','Title',3,'p_Title','suggestion_yacc.py',60),
-  ('Author -> AUTHOR SEMICOLON Text','Author',3,'p_Author','suggestion_yacc.py',65),
-  ('Description -> DESCRIPTION SEMICOLON Text','Description',3,'p_Description','suggestion_yacc.py',70),
-  ('Genre -> GENRE SEMICOLON Text','Genre',3,'p_Genre','suggestion_yacc.py',75),
-  ('Date -> DATE SEMICOLON Text','Date',3,'p_Date','suggestion_yacc.py',80),
-  ('Notes -> NOTES SEMICOLON Text','Notes',3,'p_Notes','suggestion_yacc.py',85),
-  ('Reviews -> REVIEWS SEMICOLON Text','Reviews',3,'p_Reviews','suggestion_yacc.py',90),
-  ('Links -> LINKS SEMICOLON Text','Links',3,'p_Links','suggestion_yacc.py',95),
-  ('Download -> DOWNLOAD SEMICOLON Text','Download',3,'p_Download','suggestion_yacc.py',100),
-  ('Pages -> PAGES SEMICOLON Text','Pages',3,'p_Pages','suggestion_yacc.py',105),
-  ('Goodreads -> GOODREADS SEMICOLON Text','Goodreads',3,'p_Goodreads','suggestion_yacc.py',110),
-  ('Wikipedia -> WIKIPEDIA SEMICOLON Text','Wikipedia',3,'p_Wikipedia','suggestion_yacc.py',115),
-  ('Quotes -> QUOTES SEMICOLON Text','Quotes',3,'p_Quotes','suggestion_yacc.py',120),
-  ('Text -> Text TEXT','Text',2,'p_Text','suggestion_yacc.py',125),
-  ('Text -> TEXT','Text',1,'p_Text','suggestion_yacc.py',126),
+  ('All -> Suggestions','All',1,'p_All','suggestion_yacc.py',14),
+  ('All -> Text Suggestions','All',2,'p_All','suggestion_yacc.py',15),
+  ('Suggestions -> Suggestions Suggestion','Suggestions',2,'p_Suggestions','suggestion_yacc.py',24),
+  ('Suggestions -> Suggestion','Suggestions',1,'p_Suggestions','suggestion_yacc.py',25),
+  ('Suggestion -> Title OtherElements','Suggestion',2,'p_Suggestion','suggestion_yacc.py',35),
+  ('OtherElements -> OtherElements OtherElement','OtherElements',2,'p_OtherElements','suggestion_yacc.py',42),
+  ('OtherElements -> <empty>','OtherElements',0,'p_OtherElements','suggestion_yacc.py',43),
+  ('OtherElement -> Author','OtherElement',1,'p_OtherElement','suggestion_yacc.py',53),
+  ('OtherElement -> Description','OtherElement',1,'p_OtherElement','suggestion_yacc.py',54),
+  ('OtherElement -> Genre','OtherElement',1,'p_OtherElement','suggestion_yacc.py',55),
+  ('OtherElement -> Date','OtherElement',1,'p_OtherElement','suggestion_yacc.py',56),
+  ('OtherElement -> Notes','OtherElement',1,'p_OtherElement','suggestion_yacc.py',57),
+  ('OtherElement -> Reviews','OtherElement',1,'p_OtherElement','suggestion_yacc.py',58),
+  ('OtherElement -> Links','OtherElement',1,'p_OtherElement','suggestion_yacc.py',59),
+  ('OtherElement -> Download','OtherElement',1,'p_OtherElement','suggestion_yacc.py',60),
+  ('OtherElement -> Pages','OtherElement',1,'p_OtherElement','suggestion_yacc.py',61),
+  ('OtherElement -> Goodreads','OtherElement',1,'p_OtherElement','suggestion_yacc.py',62),
+  ('OtherElement -> Wikipedia','OtherElement',1,'p_OtherElement','suggestion_yacc.py',63),
+  ('OtherElement -> Quotes','OtherElement',1,'p_OtherElement','suggestion_yacc.py',64),
+  ('Title -> TITLE SEMICOLON Text','Title',3,'p_Title','suggestion_yacc.py',70),
+  ('Author -> AUTHOR SEMICOLON Text','Author',3,'p_Author','suggestion_yacc.py',75),
+  ('Description -> DESCRIPTION SEMICOLON Text','Description',3,'p_Description','suggestion_yacc.py',80),
+  ('Genre -> GENRE SEMICOLON Text','Genre',3,'p_Genre','suggestion_yacc.py',85),
+  ('Date -> DATE SEMICOLON Text','Date',3,'p_Date','suggestion_yacc.py',90),
+  ('Notes -> NOTES SEMICOLON Text','Notes',3,'p_Notes','suggestion_yacc.py',95),
+  ('Reviews -> REVIEWS SEMICOLON Text','Reviews',3,'p_Reviews','suggestion_yacc.py',100),
+  ('Links -> LINKS SEMICOLON Text','Links',3,'p_Links','suggestion_yacc.py',105),
+  ('Download -> DOWNLOAD SEMICOLON Text','Download',3,'p_Download','suggestion_yacc.py',110),
+  ('Pages -> PAGES SEMICOLON Text','Pages',3,'p_Pages','suggestion_yacc.py',115),
+  ('Goodreads -> GOODREADS SEMICOLON Text','Goodreads',3,'p_Goodreads','suggestion_yacc.py',120),
+  ('Wikipedia -> WIKIPEDIA SEMICOLON Text','Wikipedia',3,'p_Wikipedia','suggestion_yacc.py',125),
+  ('Quotes -> QUOTES SEMICOLON Text','Quotes',3,'p_Quotes','suggestion_yacc.py',130),
+  ('Text -> Text TEXT','Text',2,'p_Text','suggestion_yacc.py',135),
+  ('Text -> TEXT','Text',1,'p_Text','suggestion_yacc.py',136),
 ]
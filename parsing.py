@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import suggestion_yacc
+from utils import clean_string_before_parsing
+
+_worker = threading.local()
+
+
+def _init_worker(engine: str) -> None:
+    _worker.engine = engine
+
+
+def normalize_message(content: str) -> str:
+    return clean_string_before_parsing(content).lower()
+
+
+def content_hash(content: str) -> str:
+    """Hash of a message's raw content, used by the ingestion ledger to tell whether a message changed."""
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def parse_message(content: str) -> tuple[tuple | None, float]:
+    """
+    Cleans, lowercases and parses a message with the parser and lexer of the current worker, creating them on first
+    use. Returns the suggestions as tuples of (field, text) pairs, so results can be shared, and how long it took.
+    """
+    if not hasattr(_worker, 'parser'):
+        _worker.parser = suggestion_yacc.make_parser()
+        _worker.lexer = suggestion_yacc.lexers[getattr(_worker, 'engine', 'ply')].clone()
+    start = time.perf_counter()
+    # Cleaning is quadratic on some decorations, it stays off the event loop too
+    text = normalize_message(content)
+    result = _worker.parser.parse(text, lexer=_worker.lexer)
+    if result is not None:
+        result = tuple(tuple(suggestion) for suggestion in result)
+    return result, time.perf_counter() - start
+
+
+class ParseQueueFull(Exception):
+    """Raised instead of queueing a message when `max_queued` messages already wait for the pool."""
+
+
+class ParseCache:
+    """
+    LRU cache of parse results, keyed by a hash of the raw message and of the grammar version, and bounded
+    by the approximate number of bytes of the cached results.
+
+    Keys are taken from the raw message rather than the normalized one: normalizing costs up to milliseconds on long
+    decorated messages and would have to run on the event loop before every lookup, while the hash of the raw content
+    is cheap. Messages that only differ in formatting get their own entries, reposts and duplicates still hit.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, version: str = suggestion_yacc.GRAMMAR_VERSION) -> None:
+        self.max_bytes = max_bytes
+        self.version = version
+        self.entries: OrderedDict[bytes, tuple[tuple | None, int]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, content: str) -> bytes:
+        return hashlib.blake2b(content.encode(), digest_size=16, person=self.version[:16].encode()).digest()
+
+    def get(self, key: bytes) -> tuple[bool, tuple | None]:
+        """Returns (found, result)."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[0]
+
+    def put(self, key: bytes, result: tuple | None) -> None:
+        size = 100 + sum(len(text) for suggestion in result or () for _, text in suggestion)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (result, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class ParsingService:
+    """
+    Parses messages on a pool of threads or processes so the event loop isn't blocked by large messages.
+
+    Every worker has its own parser and lexer. At most `max_pending` messages are handed to the pool at once, further
+    calls wait for a slot, and past `max_queued` waiting calls new ones are shed: they raise ParseQueueFull, unless
+    they're made with `shed=False`. Results are memoized in a ParseCache, so the same content is only parsed once.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 100, max_queued: int = 1000, mode: str = 'thread',
+                 engine: str = 'ply', cache_bytes: int = 8 * 1024 * 1024) -> None:
+        if mode == 'process':
+            self.executor: Executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(engine,))
+        elif mode == 'thread':
+            self.executor: Executor = ThreadPoolExecutor(workers, thread_name_prefix='parser',
+                                                         initializer=_init_worker, initargs=(engine,))
+        else:
+            raise ValueError(f"Unknown parsing mode '{mode}'")
+        self.max_pending = max_pending
+        self.max_queued = max_queued
+        self.cache = ParseCache(cache_bytes)
+        self._inflight: dict[bytes, asyncio.Future] = {}
+        self._slots = asyncio.Semaphore(max_pending)
+        self.waiting = 0
+        self.running = 0
+        self.shed = 0
+        self.calls = 0
+        self.parse_time = 0.0
+        self.max_parse_time = 0.0
+        self.wait_time = 0.0
+
+    async def parse(self, content: str, shed: bool = True) -> tuple | None:
+        """
+        Cleans, lowercases and parses a message. Returns the suggestions found, or None. Raises ParseQueueFull when
+        the queue is full, unless `shed` is False.
+        """
+        key = self.cache.key(content)
+        found, result = self.cache.get(key)
+        if found:
+            return result
+
+        # Identical messages arriving together are parsed once
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._parse(content, shed)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieved here so asyncio doesn't warn when nobody else was waiting for it
+            future.exception()
+            raise
+        else:
+            self.cache.put(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _parse(self, content: str, shed: bool) -> tuple | None:
+        if shed and self._slots.locked() and self.waiting >= self.max_queued:
+            self.shed += 1
+            raise ParseQueueFull(f"{self.waiting} messages are already waiting to be parsed")
+        queued = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.wait_time += time.perf_counter() - queued
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, elapsed = await loop.run_in_executor(self.executor, parse_message, content)
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+        self.calls += 1
+        self.parse_time += elapsed
+        self.max_parse_time = max(self.max_parse_time, elapsed)
+        return result
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
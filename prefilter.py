@@ -0,0 +1,25 @@
+import re
+
+from suggestion_lexer import keywords
+
+
+class SuggestionPreFilter:
+    """
+    Cheap check run before the parser. A message can only contain a suggestion if the lexer can produce a TITLE
+    token from it, which needs one of the title aliases followed by at most 5 characters and a colon. Messages
+    without such a header are skipped without being cleaned, lowercased or lexed.
+    """
+
+    def __init__(self) -> None:
+        # Same alias alternation and flags as the lexer (PLY compiles its rules with re.VERBOSE)
+        self.pattern = re.compile(r'(?:' + keywords['TITLE'] + r')[^\:]{0,5}\:', re.IGNORECASE | re.VERBOSE)
+        self.skipped = 0
+        self.parsed = 0
+
+    def check(self, content: str) -> bool:
+        """Returns True if the message may contain a suggestion and has to be parsed."""
+        if self.pattern.search(content) is None:
+            self.skipped += 1
+            return False
+        self.parsed += 1
+        return True
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+
+import discord
+from discord import app_commands
+
+from logs import LocalQueueHandler, compress_rotated
+from suggestion_lexer import keywords
+
+# Words of the keyword aliases, kept by the anonymization so the parser still finds the same fields
+KEYWORD_WORDS = frozenset(word for aliases in keywords.values() for word in re.findall(r'[^\W\d_]+', aliases))
+
+_words = re.compile(r'[^\W\d_]+')
+_mentions = re.compile(r'<(@!?|@&|#)(\d+)>')
+
+
+class EventRecorder:
+    """
+    Records the messages received by on_message and the application commands invoked, so a day of traffic can be
+    replayed offline (see benchmarks/replay.py). Events are written one compact JSON object per line:
+
+        {"t": time, "e": "m", "id": message, "g": guild, "gn": guild name, "c": channel, "u": author,
+         "n": author name, "b": 1 if the author is a bot, "x": content}
+        {"t": time, "e": "i", "g": guild, "gn": guild name, "c": channel, "u": user, "n": user name,
+         "x": "command arguments"}
+
+    Context menu commands act on a message or member that isn't recorded, they can't be replayed and are only
+    counted in `skipped`.
+
+    Like the logs, the file is written by a listener thread and rotated by size, the rotated files are compressed.
+
+    With `anonymize`, ids are replaced by keyed hashes and names by placeholders, and every word of the contents
+    is replaced by a pseudo-word of the same length, except keyword aliases and command names. The same word or id
+    gets the same replacement as long as the key is the same, so parse cache hits, per-guild activity and the edits
+    and deletes of a message are kept across restarts and rotated files. The key is `key` (hex) when given, otherwise
+    it's read from `<path>.key`, created on the first anonymized recording.
+    """
+
+    def __init__(self, path: str, prefix: str, anonymize: bool = False, key: str = None,
+                 max_bytes: int = 50 * 1024 * 1024, backups: int = 10) -> None:
+        self.prefix = prefix
+        self.anonymize = anonymize
+        if key:
+            self.key = bytes.fromhex(key)
+        else:
+            self.key = self._load_key(path + '.key') if anonymize else None
+        self.recorded = 0
+        self.skipped = 0
+
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.namer = lambda name: name + '.gz'
+        handler.rotator = compress_rotated
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        records = queue.SimpleQueue()
+        self.logger = logging.getLogger('bot.recorder')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = LocalQueueHandler(records)
+        self.logger.addHandler(self.handler)
+        self.listener = QueueListener(records, handler)
+        self.listener.start()
+
+    @staticmethod
+    def _load_key(path: str) -> bytes:
+        """The key kept in `path`, a new one is written there the first time."""
+        try:
+            with open(path, encoding='utf-8') as file:
+                return bytes.fromhex(file.read().strip())
+        except FileNotFoundError:
+            key = os.urandom(16)
+            # Only the owner may read it, it's what keeps the recordings anonymous
+            with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w', encoding='utf-8') as file:
+                file.write(key.hex())
+            return key
+
+    def record_message(self, message: discord.Message) -> None:
+        event = {
+            't': round(time.time(), 3),
+            'e': 'm',
+            'id': self._id(message.id),
+            'g': self._id(message.guild.id) if message.guild is not None else None,
+            'gn': self._name('guild', message.guild.id, message.guild.name) if message.guild is not None else None,
+            'c': self._id(message.channel.id),
+            'u': self._id(message.author.id),
+            'n': self._name('user', message.author.id, message.author.name),
+            'x': self._content(message.content, self.prefix),
+        }
+        if message.author.bot:
+            event['b'] = 1
+        self._write(event)
+
+    def record_interaction(self, interaction: discord.Interaction) -> None:
+        """Records an application command as the text of the equivalent prefix command, without the prefix."""
+        if interaction.type != discord.InteractionType.application_command or interaction.command is None:
+            return
+        if isinstance(interaction.command, app_commands.ContextMenu):
+            self.skipped += 1
+            return
+        options = (interaction.data or {}).get('options', [])
+        arguments = ' '.join(str(option.get('value', '')) for option in options)
+        text = f"{interaction.command.qualified_name} {arguments}".strip()
+        self._write({
+            't': round(time.time(), 3),
+            'e': 'i',
+            'g': self._id(interaction.guild_id) if interaction.guild_id is not None else None,
+            'gn': self._name('guild', interaction.guild.id, interaction.guild.name)
+            if interaction.guild is not None else None,
+            'c': self._id(interaction.channel_id) if interaction.channel_id is not None else None,
+            'u': self._id(interaction.user.id),
+            'n': self._name('user', interaction.user.id, interaction.user.name),
+            'x': self._content(text, ''),
+        })
+
+    def _write(self, event: dict) -> None:
+        self.recorded += 1
+        self.logger.info(json.dumps(event, ensure_ascii=False, separators=(',', ':')))
+
+    def _id(self, value: int) -> int:
+        if not self.anonymize:
+            return value
+        # Stays a positive 63-bit integer, like a snowflake
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8, key=self.key).digest()
+        return int.from_bytes(digest, 'big') >> 1
+
+    def _name(self, kind: str, value: int, name: str) -> str:
+        return f"{kind}{self._id(value)}" if self.anonymize else name
+
+    def _content(self, content: str, prefix: str) -> str:
+        if not self.anonymize:
+            return content
+        content = _mentions.sub(lambda match: f"<{match.group(1)}{self._id(int(match.group(2)))}>", content)
+        # The prefix and name of a command are kept
+        command = re.match(re.escape(prefix) + r'\S*', content)
+        keep = command.end() if command else 0
+        return content[:keep] + _words.sub(self._pseudo_word, content[keep:])
+
+    def _pseudo_word(self, match: re.Match) -> str:
+        word = match.group()
+        if word.lower() in KEYWORD_WORDS:
+            return word
+        digest = hashlib.blake2b(word.lower().encode(), digest_size=16, key=self.key).digest()
+        letters = ''.join(chr(ord('a') + byte % 26) for byte in digest * (len(word) // 16 + 1))[:len(word)]
+        return letters.capitalize() if word[0].isupper() else letters
+
+    def close(self) -> None:
+        """Writes the events still queued and closes the file."""
+        self.listener.stop()
+        self.logger.removeHandler(self.handler)
+        for handler in self.listener.handlers:
+            handler.close()
@@ -0,0 +1,573 @@
+import copy
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+
+
+class Storage(ABC):
+    """
+    Interface shared by the storage backends.
+
+    Guilds are identified by their Discord id, suggestions are grouped by month (MM/YY) and by the id (str) of the
+    user that made them, and every suggestion carries its own UUID under the 'id' key (and a 'revision' number once
+    the message it was taken from was edited). A guild document may also have
+    a 'settings' dict (e.g. {'scan_limit': 1000}), a 'checkpoints' dict with the scan progress of each channel,
+    keyed by the channel id (str), and a 'messages' dict, the ingestion ledger, that maps the id (str) of every message
+    suggestions were taken from to {'hash': content hash, 'month': month, 'suggestions': [suggestion ids]}.
+    """
+
+    @abstractmethod
+    def add_server_if_not_exists(self, server_id: int, server_name: str) -> bool:
+        """Adds a guild to the storage. Returns True if the guild was added, False if it already existed."""
+
+    @abstractmethod
+    def has_server(self, server_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def get_server(self, server_id: int) -> dict | None:
+        """Returns the guild document ({'server_id', 'server_name', 'months'}) or None if there is no such guild."""
+
+    @abstractmethod
+    def get_servers(self) -> list:
+        """Returns every guild document."""
+
+    @abstractmethod
+    def get_month(self, server_id: int, month: str) -> dict:
+        """Returns the suggestions of a month grouped by user id. Empty if the month has no suggestions."""
+
+    @abstractmethod
+    def add_suggestions(self, server_id: int, month: str, user_id: str, suggestions: list) -> None:
+        ...
+
+    @abstractmethod
+    def remove_suggestion(self, server_id: int, user_id: str, suggestion_id: str) -> bool:
+        """Removes a suggestion made by the given user. Returns False if there was no such suggestion."""
+
+    @abstractmethod
+    def update_suggestion(self, server_id: int, suggestion: dict) -> bool:
+        """Replaces the suggestion with the same id. Returns False if there was no such suggestion."""
+
+    @abstractmethod
+    def set_settings(self, server_id: int, settings: dict) -> None:
+        """Replaces the settings of a guild."""
+
+    @abstractmethod
+    def set_checkpoint(self, server_id: int, channel_id: str, checkpoint: dict) -> None:
+        """Replaces the scan checkpoint of a channel."""
+
+    @abstractmethod
+    def set_message(self, server_id: int, message_id: str, entry: dict | None) -> None:
+        """Replaces the ingestion ledger entry of a message, or removes it if entry is None."""
+
+    @abstractmethod
+    def get_user_names(self) -> dict:
+        """Returns the cached user names, as user id (str) -> (name, time it was fetched)."""
+
+    @abstractmethod
+    def set_user_names(self, names: dict) -> None:
+        """Adds or replaces cached user names, given as user id (str) -> (name, time it was fetched)."""
+
+    def apply(self, operations: list) -> None:
+        """
+        Applies a batch of writes. Each operation is a tuple whose first element names the method it stands for:
+        ('add_server', server_id, server_name), ('add', server_id, month, user_id, suggestions),
+        ('remove', server_id, user_id, suggestion_id), ('update', server_id, suggestion),
+        ('settings', server_id, settings),
+        ('checkpoint', server_id, channel_id, checkpoint) or ('message', server_id, message_id, entry).
+        Backends override this to write the batch at once.
+        """
+        for operation in operations:
+            name, *args = operation
+            if name == 'add_server':
+                self.add_server_if_not_exists(*args)
+            elif name == 'add':
+                self.add_suggestions(*args)
+            elif name == 'remove':
+                self.remove_suggestion(*args)
+            elif name == 'update':
+                self.update_suggestion(*args)
+            elif name == 'settings':
+                self.set_settings(*args)
+            elif name == 'checkpoint':
+                self.set_checkpoint(*args)
+            elif name == 'message':
+                self.set_message(*args)
+            else:
+                raise ValueError(f"Unknown storage operation '{name}'")
+
+    def close(self) -> None:
+        pass
+
+
+def apply_to_document(server: dict, operation: tuple) -> bool:
+    """Applies a write operation to a guild document in place. Returns False if it changed nothing."""
+    name, *args = operation
+    months = server['months']
+    if name == 'add':
+        month, user_id, suggestions = args[1:]
+        months.setdefault(month, {}).setdefault(user_id, []).extend(suggestions)
+        return True
+    if name == 'remove':
+        user_id, suggestion_id = args[1:]
+        for month_key, month_data in months.items():
+            suggestions = month_data.get(user_id)
+            if not suggestions:
+                continue
+            for suggestion in suggestions:
+                if suggestion['id'] == suggestion_id:
+                    suggestions.remove(suggestion)
+                    if len(suggestions) == 0:
+                        month_data.pop(user_id, None)
+                    if len(month_data) == 0:
+                        months.pop(month_key, None)
+                    return True
+        return False
+    if name == 'update':
+        suggestion = args[1]
+        for users in months.values():
+            for suggestions in users.values():
+                for position, old in enumerate(suggestions):
+                    if old['id'] == suggestion['id']:
+                        suggestions[position] = dict(suggestion)
+                        return True
+        return False
+    if name == 'settings':
+        server['settings'] = dict(args[1])
+        return True
+    if name == 'checkpoint':
+        server.setdefault('checkpoints', {})[args[1]] = dict(args[2])
+        return True
+    if name == 'message':
+        message_id, entry = args[1:]
+        if entry is None:
+            return server.setdefault('messages', {}).pop(message_id, None) is not None
+        server.setdefault('messages', {})[message_id] = dict(entry)
+        return True
+    if name == 'add_server':
+        return False
+    raise ValueError(f"Unknown storage operation '{name}'")
+
+
+class TinyDBStorage(Storage):
+    """
+    Stores each guild as a single TinyDB document. Every write rewrites the whole JSON file.
+
+    Guilds are looked up by TinyDB document id through the `doc_ids` map (server_id -> doc_id) instead of a query
+    that scans the table.
+    """
+
+    def __init__(self, path: str | None) -> None:
+        # Without a path the database is kept in memory only (e.g. for offline replays)
+        self.db = TinyDB(path) if path is not None else TinyDB(storage=MemoryStorage)
+        self.doc_ids = {server['server_id']: server.doc_id for server in self.db.all()}
+        self.users = self.db.table('users')
+
+    def _get(self, server_id: int) -> dict | None:
+        doc_id = self.doc_ids.get(server_id)
+        if doc_id is None:
+            return None
+        # TinyDB hands out its cached documents, copy them so callers can't alias each other
+        return copy.deepcopy(self.db.get(doc_id=doc_id))
+
+    def add_server_if_not_exists(self, server_id: int, server_name: str) -> bool:
+        if server_id in self.doc_ids:
+            return False
+        self.doc_ids[server_id] = self.db.insert({
+            'server_id': server_id,
+            'server_name': server_name,
+            'months': {},
+        })
+        return True
+
+    def has_server(self, server_id: int) -> bool:
+        return server_id in self.doc_ids
+
+    def get_server(self, server_id: int) -> dict | None:
+        return self._get(server_id)
+
+    def get_servers(self) -> list:
+        return self.db.all()
+
+    def get_month(self, server_id: int, month: str) -> dict:
+        server = self._get(server_id)
+        if server is None:
+            return {}
+        return server['months'].get(month, {})
+
+    def add_suggestions(self, server_id: int, month: str, user_id: str, suggestions: list) -> None:
+        self.apply([('add', server_id, month, user_id, suggestions)])
+
+    def set_settings(self, server_id: int, settings: dict) -> None:
+        self.apply([('settings', server_id, settings)])
+
+    def set_checkpoint(self, server_id: int, channel_id: str, checkpoint: dict) -> None:
+        self.apply([('checkpoint', server_id, channel_id, checkpoint)])
+
+    def set_message(self, server_id: int, message_id: str, entry: dict | None) -> None:
+        self.apply([('message', server_id, message_id, entry)])
+
+    def remove_suggestion(self, server_id: int, user_id: str, suggestion_id: str) -> bool:
+        server = self._get(server_id)
+        if server is None or not apply_to_document(server, ('remove', server_id, user_id, suggestion_id)):
+            return False
+        self.db.update({'months': server['months']}, doc_ids=[self.doc_ids[server_id]])
+        return True
+
+    def update_suggestion(self, server_id: int, suggestion: dict) -> bool:
+        server = self._get(server_id)
+        if server is None or not apply_to_document(server, ('update', server_id, suggestion)):
+            return False
+        self.db.update({'months': server['months']}, doc_ids=[self.doc_ids[server_id]])
+        return True
+
+    def get_user_names(self) -> dict:
+        return {user['user_id']: (user['name'], user['fetched_at']) for user in self.users.all()}
+
+    def set_user_names(self, names: dict) -> None:
+        # The table is small, rewriting it is a single write instead of one per user
+        users = {**self.get_user_names(), **names}
+        self.users.truncate()
+        self.users.insert_multiple(
+            {'user_id': user_id, 'name': name, 'fetched_at': fetched_at}
+            for user_id, (name, fetched_at) in users.items()
+        )
+
+    def apply(self, operations: list) -> None:
+        # At most one write for the new guilds and one for the changed ones
+        servers, new, changed = {}, {}, set()
+        for operation in operations:
+            server_id = operation[1]
+            if server_id not in servers:
+                servers[server_id] = self._get(server_id)
+            if operation[0] == 'add_server':
+                if servers[server_id] is None:
+                    servers[server_id] = new[server_id] = {'server_id': server_id, 'server_name': operation[2],
+                                                           'months': {}}
+                continue
+            apply_to_document(servers[server_id], operation)
+            if server_id not in new:
+                changed.add(server_id)
+
+        if new:
+            doc_ids = self.db.insert_multiple(list(new.values()))
+            self.doc_ids.update(zip(new.keys(), doc_ids))
+        if changed:
+            self.db.update(
+                lambda document: document.update(servers[document['server_id']]),
+                doc_ids=[self.doc_ids[server_id] for server_id in changed]
+            )
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class SQLiteStorage(Storage):
+    """
+    Stores guilds and suggestions as rows of a SQLite database, so adding or removing a suggestion only touches the
+    rows involved. Suggestions keep their insertion order through the 'seq' column.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS guilds (
+            server_id   INTEGER PRIMARY KEY,
+            server_name TEXT NOT NULL,
+            settings    TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS suggestions (
+            seq      INTEGER PRIMARY KEY AUTOINCREMENT,
+            id       TEXT NOT NULL UNIQUE,
+            guild_id INTEGER NOT NULL REFERENCES guilds (server_id) ON DELETE CASCADE,
+            month    TEXT NOT NULL,
+            user_id  TEXT NOT NULL,
+            data     TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS suggestions_guild_month_user ON suggestions (guild_id, month, user_id);
+        CREATE TABLE IF NOT EXISTS checkpoints (
+            guild_id   INTEGER NOT NULL REFERENCES guilds (server_id) ON DELETE CASCADE,
+            channel_id TEXT NOT NULL,
+            data       TEXT NOT NULL,
+            PRIMARY KEY (guild_id, channel_id)
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            guild_id       INTEGER NOT NULL REFERENCES guilds (server_id) ON DELETE CASCADE,
+            message_id     TEXT NOT NULL,
+            hash           TEXT NOT NULL,
+            month          TEXT NOT NULL,
+            suggestion_ids TEXT NOT NULL,
+            PRIMARY KEY (guild_id, message_id)
+        );
+        CREATE TABLE IF NOT EXISTS user_names (
+            user_id    TEXT PRIMARY KEY,
+            name       TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str) -> None:
+        # The bot calls the storage from executor threads, the lock serializes them on the single connection
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("PRAGMA foreign_keys=ON")
+            self.connection.executescript(self.SCHEMA)
+            self._upgrade_schema()
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM guilds LIMIT 1").fetchone() is None
+
+    def _upgrade_schema(self) -> None:
+        # Adds the columns introduced after a database was created
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(guilds)")}
+        if 'settings' not in columns:
+            self.connection.execute("ALTER TABLE guilds ADD COLUMN settings TEXT NOT NULL DEFAULT '{}'")
+
+    @staticmethod
+    def _to_row_data(suggestion: dict) -> str:
+        return json.dumps({k: v for k, v in suggestion.items() if k != 'id'}, ensure_ascii=False)
+
+    @staticmethod
+    def _from_row(suggestion_id: str, data: str) -> dict:
+        suggestion = json.loads(data)
+        suggestion['id'] = suggestion_id
+        return suggestion
+
+    @staticmethod
+    def _message_entry(content_hash: str, month: str, suggestion_ids: str) -> dict:
+        return {'hash': content_hash, 'month': month, 'suggestions': json.loads(suggestion_ids)}
+
+    def add_server_if_not_exists(self, server_id: int, server_name: str) -> bool:
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO guilds (server_id, server_name) VALUES (?, ?)", (server_id, server_name)
+            )
+            return cursor.rowcount == 1
+
+    def has_server(self, server_id: int) -> bool:
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM guilds WHERE server_id = ?", (server_id,)).fetchone()
+        return row is not None
+
+    def get_server(self, server_id: int) -> dict | None:
+        with self.lock:
+            guild = self.connection.execute(
+                "SELECT server_name, settings FROM guilds WHERE server_id = ?", (server_id,)
+            ).fetchone()
+            if guild is None:
+                return None
+            rows = self.connection.execute(
+                "SELECT month, user_id, id, data FROM suggestions WHERE guild_id = ? ORDER BY seq", (server_id,)
+            ).fetchall()
+            checkpoints = self.connection.execute(
+                "SELECT channel_id, data FROM checkpoints WHERE guild_id = ?", (server_id,)
+            ).fetchall()
+            messages = self.connection.execute(
+                "SELECT message_id, hash, month, suggestion_ids FROM messages WHERE guild_id = ?", (server_id,)
+            ).fetchall()
+
+        server = {'server_id': server_id, 'server_name': guild[0], 'months': {}, 'settings': json.loads(guild[1]),
+                  'checkpoints': {channel_id: json.loads(data) for channel_id, data in checkpoints},
+                  'messages': {message_id: self._message_entry(*row) for message_id, *row in messages}}
+        for month, user_id, suggestion_id, data in rows:
+            server['months'].setdefault(month, {}).setdefault(user_id, []).append(self._from_row(suggestion_id, data))
+        return server
+
+    def get_servers(self) -> list:
+        with self.lock:
+            guilds = self.connection.execute("SELECT server_id, server_name, settings FROM guilds").fetchall()
+            rows = self.connection.execute(
+                "SELECT guild_id, month, user_id, id, data FROM suggestions ORDER BY seq"
+            ).fetchall()
+            checkpoints = self.connection.execute("SELECT guild_id, channel_id, data FROM checkpoints").fetchall()
+            messages = self.connection.execute(
+                "SELECT guild_id, message_id, hash, month, suggestion_ids FROM messages"
+            ).fetchall()
+
+        servers = {server_id: {'server_id': server_id, 'server_name': server_name, 'months': {},
+                               'settings': json.loads(settings), 'checkpoints': {}, 'messages': {}}
+                   for server_id, server_name, settings in guilds}
+        for guild_id, channel_id, data in checkpoints:
+            servers[guild_id]['checkpoints'][channel_id] = json.loads(data)
+        for guild_id, message_id, *row in messages:
+            servers[guild_id]['messages'][message_id] = self._message_entry(*row)
+        for guild_id, month, user_id, suggestion_id, data in rows:
+            months = servers[guild_id]['months']
+            months.setdefault(month, {}).setdefault(user_id, []).append(self._from_row(suggestion_id, data))
+        return list(servers.values())
+
+    def get_month(self, server_id: int, month: str) -> dict:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT user_id, id, data FROM suggestions WHERE guild_id = ? AND month = ? ORDER BY seq",
+                (server_id, month)
+            ).fetchall()
+
+        result = {}
+        for user_id, suggestion_id, data in rows:
+            result.setdefault(user_id, []).append(self._from_row(suggestion_id, data))
+        return result
+
+    def add_suggestions(self, server_id: int, month: str, user_id: str, suggestions: list) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO suggestions (id, guild_id, month, user_id, data) VALUES (?, ?, ?, ?, ?)",
+                [(s['id'], server_id, month, user_id, self._to_row_data(s)) for s in suggestions]
+            )
+
+    def remove_suggestion(self, server_id: int, user_id: str, suggestion_id: str) -> bool:
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM suggestions WHERE id = ? AND guild_id = ? AND user_id = ?",
+                (suggestion_id, server_id, user_id)
+            )
+            return cursor.rowcount == 1
+
+    def update_suggestion(self, server_id: int, suggestion: dict) -> bool:
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "UPDATE suggestions SET data = ? WHERE id = ? AND guild_id = ?",
+                (self._to_row_data(suggestion), suggestion['id'], server_id)
+            )
+            return cursor.rowcount == 1
+
+    def set_settings(self, server_id: int, settings: dict) -> None:
+        self.apply([('settings', server_id, settings)])
+
+    def set_checkpoint(self, server_id: int, channel_id: str, checkpoint: dict) -> None:
+        self.apply([('checkpoint', server_id, channel_id, checkpoint)])
+
+    def set_message(self, server_id: int, message_id: str, entry: dict | None) -> None:
+        self.apply([('message', server_id, message_id, entry)])
+
+    def get_user_names(self) -> dict:
+        with self.lock:
+            rows = self.connection.execute("SELECT user_id, name, fetched_at FROM user_names").fetchall()
+        return {user_id: (name, fetched_at) for user_id, name, fetched_at in rows}
+
+    def set_user_names(self, names: dict) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO user_names (user_id, name, fetched_at) VALUES (?, ?, ?)",
+                [(user_id, name, fetched_at) for user_id, (name, fetched_at) in names.items()]
+            )
+
+    def apply(self, operations: list) -> None:
+        with self.lock, self.connection:
+            for operation in operations:
+                name, *args = operation
+                if name == 'add_server':
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO guilds (server_id, server_name) VALUES (?, ?)", args
+                    )
+                elif name == 'add':
+                    server_id, month, user_id, suggestions = args
+                    self.connection.executemany(
+                        "INSERT INTO suggestions (id, guild_id, month, user_id, data) VALUES (?, ?, ?, ?, ?)",
+                        [(s['id'], server_id, month, user_id, self._to_row_data(s)) for s in suggestions]
+                    )
+                elif name == 'remove':
+                    server_id, user_id, suggestion_id = args
+                    self.connection.execute(
+                        "DELETE FROM suggestions WHERE id = ? AND guild_id = ? AND user_id = ?",
+                        (suggestion_id, server_id, user_id)
+                    )
+                elif name == 'update':
+                    server_id, suggestion = args
+                    self.connection.execute(
+                        "UPDATE suggestions SET data = ? WHERE id = ? AND guild_id = ?",
+                        (self._to_row_data(suggestion), suggestion['id'], server_id)
+                    )
+                elif name == 'settings':
+                    server_id, settings = args
+                    self.connection.execute(
+                        "UPDATE guilds SET settings = ? WHERE server_id = ?", (json.dumps(settings), server_id)
+                    )
+                elif name == 'checkpoint':
+                    server_id, channel_id, checkpoint = args
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO checkpoints (guild_id, channel_id, data) VALUES (?, ?, ?)",
+                        (server_id, channel_id, json.dumps(checkpoint))
+                    )
+                elif name == 'message':
+                    server_id, message_id, entry = args
+                    if entry is None:
+                        self.connection.execute(
+                            "DELETE FROM messages WHERE guild_id = ? AND message_id = ?", (server_id, message_id)
+                        )
+                    else:
+                        self.connection.execute(
+                            "INSERT OR REPLACE INTO messages (guild_id, message_id, hash, month, suggestion_ids) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (server_id, message_id, entry['hash'], entry['month'], json.dumps(entry['suggestions']))
+                        )
+                else:
+                    raise ValueError(f"Unknown storage operation '{name}'")
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+def create_storage(config: dict) -> Storage:
+    backend = config.get("storage", "tinydb")
+    if backend == "sqlite":
+        path = config.get("database", "db.sqlite3")
+        storage = SQLiteStorage(path)
+        # The first time the bot runs on SQLite, the guilds of the TinyDB database it used before are copied over
+        legacy = config.get("migrate_from", "db.json")
+        if legacy and os.path.isfile(legacy) and storage.is_empty():
+            source = TinyDBStorage(legacy)
+            count = migrate(source, storage)
+            source.close()
+            logging.getLogger('bot').info(f"Migrated {count} suggestions from {legacy} to {path}.")
+        return storage
+    if backend == "tinydb":
+        return TinyDBStorage(config.get("database", "db.json"))
+    if backend == "memory":
+        return TinyDBStorage(None)
+    raise ValueError(f"Unknown storage backend '{backend}'")
+
+
+def migrate(source: Storage, target: Storage) -> int:
+    """
+    Copies every guild and suggestion from one storage to another, the guilds in a single batch so an interrupted
+    migration leaves none of them behind. Returns the number of suggestions copied.
+    """
+    count = 0
+    operations = []
+    for server in source.get_servers():
+        server_id = server['server_id']
+        operations.append(('add_server', server_id, server['server_name']))
+        if server.get('settings'):
+            operations.append(('settings', server_id, server['settings']))
+        for channel_id, checkpoint in server.get('checkpoints', {}).items():
+            operations.append(('checkpoint', server_id, channel_id, checkpoint))
+        for message_id, entry in server.get('messages', {}).items():
+            operations.append(('message', server_id, message_id, entry))
+        for month, users in server['months'].items():
+            for user_id, suggestions in users.items():
+                operations.append(('add', server_id, month, user_id, suggestions))
+                count += len(suggestions)
+    target.set_user_names(source.get_user_names())
+    target.apply(operations)
+    return count
+
+
+# Migrating an existing TinyDB database: python storage.py db.json db.sqlite3
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit("Usage: python storage.py <tinydb json file> <sqlite file>")
+    old, new = TinyDBStorage(sys.argv[1]), SQLiteStorage(sys.argv[2])
+    print(f"Copied {migrate(old, new)} suggestions.")
+    old.close()
+    new.close()
@@ -1,4 +1,7 @@
+import hashlib
+
 import ply.lex as lex
+from ply.lex import TOKEN
 
 tokens = (
     'SEMICOLON',
@@ -20,6 +23,30 @@ tokens = (
 
 t_ignore = ' \n\t'
 
+# Aliases of each keyword token, tried in this order. A keyword may be preceded by markdown decorations and followed
+# by up to 5 characters before the colon (e.g. '> **Title**:')
+KEYWORD_PREFIX = r'([_*\>\-\.\=]*\s*)?'
+KEYWORD_SUFFIX = r'([^\:]{0,5})(?=\:)'
+keywords = {
+    'TITLE': r'titles|title|título|títulos|titulos|titulo|nome|nomes',
+    'AUTHOR': r'autores|autoras|autora|authors|author|autor',
+    'GENRE': r'genres|géneros|generos|categorias|género|genero|genre',
+    'DESCRIPTION': r'description|descrição|descriçao|descricao|summary|sinopse|resumo',
+    'DATE': r'publication\sdate|data\sde\spublicação|data\sde\spublicaçao|data\sde\spublicacao|release\sdate|data|date',
+    'NOTES': r'comments|comment|comentários|comentarios|comentário|comentario|thoughts|footnotes|footnote|notes|notas|nota|note',
+    'REVIEWS': r'reviews|review|avaliações|avaliaçoes|avaliacoes|avaliação|avaliaçao|avaliacao',
+    'GOODREADS': r'goodreads|link do goodreads',
+    'WIKIPEDIA': r'wikipedia|wikipédia|link\sda\swikipédia|link\sda\swikipedia|link\sdo\swikipedia|link\sdo\swikipédia|wikipédia|wikipedia|wiki',
+    'LINKS': r'link.*(?=\:)|links|link',
+    'PAGES': r'número\sde\spáginas|numero\sde\spáginas|número\sde\spaginas|numero\sde\spaginas|nº\sde\spáginas|nº\sde\spaginas|nº\spáginas|nº\spaginas|páginas|paginas|number\sof\spages|nº\sof\spages|nº\spages|pages|length|comprimento|nº',
+    'DOWNLOAD': r'download|downloads|tranferir',
+    'QUOTES': r'quote|quotes|citações|citaçoes|citacoes|citação|citaçao|citacao',
+}
+
+
+def keyword_regex(token: str) -> str:
+    return KEYWORD_PREFIX + '(?P<val>' + keywords[token] + ')' + KEYWORD_SUFFIX
+
 
 def t_SEMICOLON(t):
     r'\:'
@@ -27,80 +54,80 @@ def t_SEMICOLON(t):
     return t
 
 
+@TOKEN(keyword_regex('TITLE'))
 def t_TITLE(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>titles|title|título|títulos|titulos|titulo|nome|nomes)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('AUTHOR'))
 def t_AUTHOR(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>autores|autoras|autora|authors|author|autor)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('GENRE'))
 def t_GENRE(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>genres|géneros|generos|categorias|género|genero|genre)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('DESCRIPTION'))
 def t_DESCRIPTION(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>description|descrição|descriçao|descricao|summary|sinopse|resumo)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('DATE'))
 def t_DATE(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>publication\sdate|data\sde\spublicação|data\sde\spublicaçao|data\sde\spublicacao|release\sdate|data|date)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('NOTES'))
 def t_NOTES(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>comments|comment|comentários|comentarios|comentário|comentario|thoughts|footnotes|footnote|notes|notas|nota|note)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('REVIEWS'))
 def t_REVIEWS(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>reviews|review|avaliações|avaliaçoes|avaliacoes|avaliação|avaliaçao|avaliacao)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('GOODREADS'))
 def t_GOODREADS(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>goodreads|link do goodreads)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('WIKIPEDIA'))
 def t_WIKIPEDIA(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>wikipedia|wikipédia|link\sda\swikipédia|link\sda\swikipedia|link\sdo\swikipedia|link\sdo\swikipédia|wikipédia|wikipedia|wiki)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('LINKS'))
 def t_LINKS(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>link.*(?=\:)|links|link)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('PAGES'))
 def t_PAGES(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>número\sde\spáginas|numero\sde\spáginas|número\sde\spaginas|numero\sde\spaginas|nº\sde\spáginas|nº\sde\spaginas|nº\spáginas|nº\spaginas|páginas|paginas|number\sof\spages|nº\sof\spages|nº\spages|pages|length|comprimento|nº)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('DOWNLOAD'))
 def t_DOWNLOAD(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>download|downloads|tranferir)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
 
+@TOKEN(keyword_regex('QUOTES'))
 def t_QUOTES(t):
-    r'([_*\>\-\.\=]*\s*)?(?P<val>quote|quotes|citações|citaçoes|citacoes|citação|citaçao|citacao)([^\:]{0,5})(?=\:)'
     t.value = t.lexer.lexmatch.group('val')
     return t
 
@@ -120,7 +147,25 @@ def t_newline(t):
     t.lexer.lineno += len(t.value)
 
 
-lexer = lex.lex()
+def rules_signature() -> str:
+    # Changes whenever a token or the regex of a rule changes, actions are bound by name and aren't in the tables
+    rules = [(name, getattr(value, 'regex', value.__doc__) if callable(value) else value)
+             for name, value in globals().items() if name.startswith('t_')]
+    return hashlib.sha1(repr((tokens, rules)).encode()).hexdigest()
+
+
+def frozen_lextab():
+    """The tables frozen in suggestion_lextab.py (see suggestion_yacc.freeze_tables), if they match the rules."""
+    try:
+        import suggestion_lextab
+    except ImportError:
+        return None
+    return suggestion_lextab if getattr(suggestion_lextab, '_signature', None) == rules_signature() else None
+
+
+# Read from the frozen tables rather than compiled from the rules when they are up to date. Nothing is written.
+_lextab = frozen_lextab()
+lexer = lex.lex(optimize=True, lextab=_lextab) if _lextab is not None else lex.lex()
 
 
 # Testing
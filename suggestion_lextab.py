@@ -0,0 +1,11 @@
+# suggestion_lextab.py. This file automatically created by PLY (version 3.11). Don't edit!
+_tabversion   = '3.10'
+_lextokens    = set(('AUTHOR', 'DATE', 'DESCRIPTION', 'DOWNLOAD', 'GENRE', 'GOODREADS', 'LINKS', 'NOTES', 'PAGES', 'QUOTES', 'REVIEWS', 'SEMICOLON', 'TEXT', 'TITLE', 'WIKIPEDIA'))
+_lexreflags   = 64
+_lexliterals  = ''
+_lexstateinfo = {'INITIAL': 'inclusive'}
+_lexstatere   = {'INITIAL': [('(?P<t_SEMICOLON>\\:)|(?P<t_TITLE>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>titles|title|título|títulos|titulos|titulo|nome|nomes)([^\\:]{0,5})(?=\\:))', [None, ('t_SEMICOLON', 'SEMICOLON'), ('t_TITLE', 'TITLE'), None, None]), ('(?P<t_AUTHOR>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>autores|autoras|autora|authors|author|autor)([^\\:]{0,5})(?=\\:))', [None, ('t_AUTHOR', 'AUTHOR'), None, None]), ('(?P<t_GENRE>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>genres|géneros|generos|categorias|género|genero|genre)([^\\:]{0,5})(?=\\:))', [None, ('t_GENRE', 'GENRE'), None, None]), ('(?P<t_DESCRIPTION>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>description|descrição|descriçao|descricao|summary|sinopse|resumo)([^\\:]{0,5})(?=\\:))', [None, ('t_DESCRIPTION', 'DESCRIPTION'), None, None]), ('(?P<t_DATE>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>publication\\sdate|data\\sde\\spublicação|data\\sde\\spublicaçao|data\\sde\\spublicacao|release\\sdate|data|date)([^\\:]{0,5})(?=\\:))', [None, ('t_DATE', 'DATE'), None, None]), ('(?P<t_NOTES>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>comments|comment|comentários|comentarios|comentário|comentario|thoughts|footnotes|footnote|notes|notas|nota|note)([^\\:]{0,5})(?=\\:))', [None, ('t_NOTES', 'NOTES'), None, None]), ('(?P<t_REVIEWS>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>reviews|review|avaliações|avaliaçoes|avaliacoes|avaliação|avaliaçao|avaliacao)([^\\:]{0,5})(?=\\:))', [None, ('t_REVIEWS', 'REVIEWS'), None, None]), ('(?P<t_GOODREADS>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>goodreads|link do goodreads)([^\\:]{0,5})(?=\\:))', [None, ('t_GOODREADS', 'GOODREADS'), None, None]), ('(?P<t_WIKIPEDIA>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>wikipedia|wikipédia|link\\sda\\swikipédia|link\\sda\\swikipedia|link\\sdo\\swikipedia|link\\sdo\\swikipédia|wikipédia|wikipedia|wiki)([^\\:]{0,5})(?=\\:))', [None, ('t_WIKIPEDIA', 'WIKIPEDIA'), None, None]), ('(?P<t_LINKS>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>link.*(?=\\:)|links|link)([^\\:]{0,5})(?=\\:))', [None, ('t_LINKS', 'LINKS'), None, None]), ('(?P<t_PAGES>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>número\\sde\\spáginas|numero\\sde\\spáginas|número\\sde\\spaginas|numero\\sde\\spaginas|nº\\sde\\spáginas|nº\\sde\\spaginas|nº\\spáginas|nº\\spaginas|páginas|paginas|number\\sof\\spages|nº\\sof\\spages|nº\\spages|pages|length|comprimento|nº)([^\\:]{0,5})(?=\\:))', [None, ('t_PAGES', 'PAGES'), None, None]), ('(?P<t_DOWNLOAD>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>download|downloads|tranferir)([^\\:]{0,5})(?=\\:))', [None, ('t_DOWNLOAD', 'DOWNLOAD'), None, None]), ('(?P<t_QUOTES>([_*\\>\\-\\.\\=]*\\s*)?(?P<val>quote|quotes|citações|citaçoes|citacoes|citação|citaçao|citacao)([^\\:]{0,5})(?=\\:))', [None, ('t_QUOTES', 'QUOTES'), None, None]), ('(?P<t_TEXT>[^\\n]+)|(?P<t_newline>\\n+)', [None, ('t_TEXT', 'TEXT'), ('t_newline', 'newline')])]}
+_lexstateignore = {'INITIAL': ' \n\t'}
+_lexstateerrorf = {'INITIAL': 't_error'}
+_lexstateeoff = {}
+_signature = '8e9bd4d3e1ce1f82ab2e8b764d7ce3a6a11bc76b'
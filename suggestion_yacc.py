@@ -1,7 +1,17 @@
+import hashlib
+import importlib
+import logging
+import os
+import sys
+import ply.lex as lex
 import ply.yacc as yacc
-from suggestion_lexer import tokens
+import suggestion_lexer
+from suggestion_lexer import tokens, lexer, keywords, KEYWORD_PREFIX, KEYWORD_SUFFIX
+from suggestion_tokenizer import SuggestionTokenizer
 from typing import Tuple
 
+logger = logging.getLogger('bot.parser')
+
 
 def p_All(p):
     r"""All : Suggestions
@@ -20,13 +30,15 @@ def p_Suggestions(p):
     if len(p) == 2:
         p[0] = [p[1]]
     else:
-        p[0] = p[1] + [p[2]]
+        p[1].append(p[2])
+        p[0] = p[1]
 
 
 def p_Suggestion(p):
     r"""Suggestion : Title OtherElements
     """
-    p[0] = [p[1]] + p[2]
+    p[0] = [p[1]]
+    p[0].extend(p[2])
 
 
 def p_OtherElements(p):
@@ -36,7 +48,8 @@ def p_OtherElements(p):
     if len(p) == 1:
         p[0] = []
     else:
-        p[0] = p[1] + [p[2]]
+        p[1].append(p[2])
+        p[0] = p[1]
 
 
 def p_OtherElement(p):
@@ -58,67 +71,67 @@ def p_OtherElement(p):
 
 def p_Title(p):
     r"""Title : TITLE SEMICOLON Text"""
-    p[0] = ('title', p[3])
+    p[0] = ('title', ' '.join(p[3]))
 
 
 def p_Author(p):
     r"""Author : AUTHOR SEMICOLON Text"""
-    p[0] = ('author', p[3])
+    p[0] = ('author', ' '.join(p[3]))
 
 
 def p_Description(p):
     r"""Description : DESCRIPTION SEMICOLON Text"""
-    p[0] = ('description', p[3])
+    p[0] = ('description', ' '.join(p[3]))
 
 
 def p_Genre(p):
     r"""Genre : GENRE SEMICOLON Text"""
-    p[0] = ('genre', p[3])
+    p[0] = ('genre', ' '.join(p[3]))
 
 
 def p_Date(p):
     r"""Date : DATE SEMICOLON Text"""
-    p[0] = ('date', p[3])
+    p[0] = ('date', ' '.join(p[3]))
 
 
 def p_Notes(p):
     r"""Notes : NOTES SEMICOLON Text"""
-    p[0] = ('notes', p[3])
+    p[0] = ('notes', ' '.join(p[3]))
 
 
 def p_Reviews(p):
     r"""Reviews : REVIEWS SEMICOLON Text"""
-    p[0] = ('reviews', p[3])
+    p[0] = ('reviews', ' '.join(p[3]))
 
 
 def p_Links(p):
     r"""Links : LINKS SEMICOLON Text"""
-    p[0] = ('links', p[3])
+    p[0] = ('links', ' '.join(p[3]))
 
 
 def p_Download(p):
     r"""Download : DOWNLOAD SEMICOLON Text"""
-    p[0] = ('downloads', p[3])
+    p[0] = ('downloads', ' '.join(p[3]))
 
 
 def p_Pages(p):
     r"""Pages : PAGES SEMICOLON Text"""
-    p[0] = ('pages', p[3])
+    p[0] = ('pages', ' '.join(p[3]))
 
 
 def p_Goodreads(p):
     r"""Goodreads : GOODREADS SEMICOLON Text"""
-    p[0] = ('goodreads', p[3])
+    p[0] = ('goodreads', ' '.join(p[3]))
 
 
 def p_Wikipedia(p):
     r"""Wikipedia : WIKIPEDIA SEMICOLON Text"""
-    p[0] = ('wikipedia', p[3])
+    p[0] = ('wikipedia', ' '.join(p[3]))
 
 
 def p_Quotes(p):
     r"""Quotes : QUOTES SEMICOLON Text"""
-    p[0] = ('quotes', p[3])
+    p[0] = ('quotes', ' '.join(p[3]))
 
 
 def p_Text(p):
@@ -128,11 +141,12 @@ def p_Text(p):
     if len(p) == 2:
         p[0] = [p[1]]
     else:
-        p[0] = p[1] + [p[2]]
+        p[1].append(p[2])
+        p[0] = p[1]
 
 
 def p_error(p):
-    print("Syntax error in input!", p)
+    logger.debug("Syntax error in input! %s", p)
     parser.exito = False
 
 
@@ -168,12 +182,79 @@ def nested_array_to_string(array, level=0, tuple=False):
     return result
 
 
-parser = yacc.yacc()
+def make_parser() -> yacc.LRParser:
+    """
+    Builds a new parser from the same tables. A parser keeps its state while parsing, so threads can't share one.
+    The tables of parsetab.py are read when their signature matches the grammar, otherwise they are built in memory.
+    Neither the tables nor the parser.out debug file are written, see freeze_tables.
+    """
+    return yacc.yacc(module=sys.modules[__name__], debug=False, write_tables=False)
+
+
+parser = make_parser()
 parser.exito = True
 
+# Lexer engines the parser can be fed with: the ply lexer or the single-regex tokenizer, which yields the same tokens
+lexers = {
+    'ply': lexer,
+    'compiled': SuggestionTokenizer(),
+}
+
+
+def parse(text: str, engine: str = 'ply'):
+    return parser.parse(text, lexer=lexers[engine])
+
+
+def freeze_tables(outputdir: str = os.path.dirname(os.path.abspath(__file__))) -> None:
+    """
+    Writes the lexer tables to suggestion_lextab.py and the parser tables to parsetab.py, for imports to read
+    instead of building them. Run `python suggestion_yacc.py --freeze` after changing a token or a grammar rule.
+    """
+    lex.lex(module=suggestion_lexer).writetab('suggestion_lextab', outputdir)
+    with open(os.path.join(outputdir, 'suggestion_lextab.py'), 'a') as file:
+        file.write(f"_signature = {suggestion_lexer.rules_signature()!r}\n")
+
+    # yacc only writes the tables it had to build
+    sys.modules.pop('parsetab', None)
+    tables = os.path.join(outputdir, 'parsetab.py')
+    if os.path.exists(tables):
+        os.remove(tables)
+    importlib.invalidate_caches()
+    yacc.yacc(module=sys.modules[__name__], debug=False, write_tables=True, outputdir=outputdir)
+
+
+def tables_are_frozen() -> bool:
+    """Whether the tables of suggestion_lextab.py and parsetab.py are the ones of the current rules."""
+    try:
+        import parsetab
+    except ImportError:
+        return False
+    grammar = yacc.ParserReflect(vars(sys.modules[__name__]))
+    grammar.get_all()
+    return suggestion_lexer.frozen_lextab() is not None and parsetab._lr_signature == grammar.signature()
+
+
+def _grammar_version() -> str:
+    # Changes whenever a keyword alias, a grammar rule or a rule's action changes
+    digest = hashlib.sha1(repr((KEYWORD_PREFIX, KEYWORD_SUFFIX, keywords)).encode())
+    for name, value in sorted(globals().items()):
+        if name.startswith('p_') and callable(value):
+            digest.update(f"{name}{value.__doc__}".encode())
+            digest.update(value.__code__.co_code)
+    return digest.hexdigest()
+
+
+GRAMMAR_VERSION = _grammar_version()
+
 
 # Testing
 if __name__ == '__main__':
+    if '--freeze' in sys.argv:
+        freeze_tables()
+        print(f"Froze the tables, up to date: {tables_are_frozen()}")
+        sys.exit()
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+
     test = """
     > Title: piranesi
     > Author: Susanna Clarke
@@ -204,4 +285,14 @@ if __name__ == '__main__':
     """
 
     result = parser.parse(test2.lower())
-    print_nested_array(result)
+    if result is not None:
+        print_nested_array(result)
+
+    # Parsing time per line should stay flat as messages grow
+    import timeit
+    for lines in (10, 100, 1000, 5000):
+        text = '\n'.join(['title: long description', 'description: first line']
+                         + [f"> line {i} of the description" for i in range(lines)]
+                         + ['title: another one', 'author: someone'] * (lines // 10))
+        seconds = min(timeit.repeat(lambda: parser.parse(text), number=1, repeat=5))
+        print(f"{lines} lines: {seconds * 1e6 / lines:.2f}us per line")
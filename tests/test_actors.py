@@ -0,0 +1,141 @@
+"""
+Concurrent writes of the same guilds through GuildCache, with a storage that yields: every write is applied in the
+order it was submitted and none of the suggestions are lost.
+"""
+import asyncio
+import random
+import time
+import uuid
+
+from actors import GuildWriters
+from cache import GuildCache
+from storage import TinyDBStorage
+
+MONTH = '07/24'
+SERVERS = 4
+
+
+class YieldingStorage(TinyDBStorage):
+    """An in-memory TinyDB whose reads and writes take a while, like a file or a network database."""
+
+    def __init__(self, delay: float = 0.001) -> None:
+        super().__init__(None)
+        self.delay = delay
+
+    def get_server(self, server_id: int) -> dict | None:
+        time.sleep(self.delay)
+        return super().get_server(server_id)
+
+    def apply(self, operations: list) -> None:
+        time.sleep(self.delay)
+        super().apply(operations)
+
+
+class UnorderedWriters(GuildWriters):
+    """
+    Runs every write on its own, after a short random pause: what the cache does if a write path awaits something
+    (a load, a storage read) before changing the guild, without a queue keeping the writes of a guild in order.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.rng = random.Random(0)
+
+    async def submit(self, server_id: int, function, *args):
+        await asyncio.sleep(self.rng.random() * 0.002)
+        return function(*args)
+
+
+def suggestion(title: str) -> dict:
+    return {'title': title, 'id': str(uuid.uuid4())}
+
+
+def titles(servers: list) -> dict:
+    """server id -> sorted titles of every suggestion."""
+    return {server['server_id']: sorted(s['title'] for users in server['months'].values()
+                                        for suggestions in users.values() for s in suggestions)
+            for server in servers}
+
+
+async def write_concurrently(writers: GuildWriters, messages: int = 300) -> tuple[dict, dict, dict]:
+    """
+    Every message is ingested, then a third of them are edited and another third deleted, all submitted at once
+    with .scan batches of the same guilds. Returns the expected titles, the cached ones and the stored ones.
+    """
+    storage = YieldingStorage()
+    cache = GuildCache(storage, flush_threshold=50)
+    cache.writers = writers
+    for server_id in range(SERVERS):
+        await cache.get(server_id, f"server {server_id}")
+
+    calls, expected = [], {server_id: [] for server_id in range(SERVERS)}
+    for number in range(messages):
+        server_id, message_id, user_id = number % SERVERS, str(number), str(number % 7)
+        calls.append(cache.ingest(server_id, message_id, 'v1', MONTH, user_id, [suggestion(f"book {number}")]))
+        if number % 3 == 1:
+            revised = [suggestion(f"book {number} revised"), suggestion(f"extra {number}")]
+            calls.append(cache.revise(server_id, message_id, 'v2', user_id, revised))
+            expected[server_id] += [f"book {number} revised", f"extra {number}"]
+        elif number % 3 == 2:
+            calls.append(cache.forget(server_id, message_id))
+        else:
+            expected[server_id].append(f"book {number}")
+        if number % 20 == 0:
+            entries = [(f"scan {number}.{index}", 'v1', MONTH, 'scan', [suggestion(f"scanned {number}.{index}")])
+                       for index in range(10)]
+            calls.append(cache.add_batch(server_id, entries, ('channel', {'before': number})))
+            expected[server_id] += [f"scanned {number}.{index}" for index in range(10)]
+
+    await asyncio.gather(*calls)
+    cached = titles(list(cache.index.servers.values()))
+    await cache.close()
+    return {server_id: sorted(names) for server_id, names in expected.items()}, cached, titles(storage.get_servers())
+
+
+def test_cache_writes_are_applied_in_order_through_the_writers():
+    expected, cached, stored = asyncio.run(write_concurrently(GuildWriters()))
+    assert cached == expected
+    assert stored == expected
+
+
+def test_unordered_writes_lose_edits_and_deletes():
+    # Shows the test catches the race: edits and deletes overtake the ingest of their message
+    expected, cached, _ = asyncio.run(write_concurrently(UnorderedWriters()))
+    assert cached != expected
+
+
+def test_cache_keeps_every_suggestion():
+    # Ingests and scan batches interleaved with threshold flushes to a slow storage
+    ingests, scans, scan_size = 5000, 40, 50
+
+    async def run() -> tuple[set, set]:
+        storage = YieldingStorage()
+        cache = GuildCache(storage, flush_threshold=200)
+        sent = set()
+
+        async def ingest(number: int) -> None:
+            server_id = number % 8
+            await cache.get(server_id, f"server {server_id}")
+            suggestions = [suggestion(f"book {number}")]
+            sent.add(suggestions[0]['id'])
+            await cache.ingest(server_id, str(number), str(number), MONTH, str(number % 17), suggestions)
+
+        async def scan(server_id: int, first: int) -> None:
+            await cache.get(server_id, f"server {server_id}")
+            entries = []
+            for number in range(first, first + scan_size):
+                suggestions = [suggestion(f"book {number}")]
+                sent.add(suggestions[0]['id'])
+                entries.append((f"scan {number}", str(number), MONTH, 'scan', suggestions))
+            await cache.add_batch(server_id, entries, ('channel', {'before': first}))
+
+        await asyncio.gather(*(ingest(number) for number in range(ingests)),
+                             *(scan(number % 8, ingests + number * scan_size) for number in range(scans)))
+        await cache.close()
+        stored = {s['id'] for server in storage.get_servers() for users in server['months'].values()
+                  for suggestions in users.values() for s in suggestions}
+        return sent, stored
+
+    sent, stored = asyncio.run(run())
+    assert len(sent) == ingests + scans * scan_size
+    assert sent == stored
@@ -0,0 +1,43 @@
+"""
+What on_message does with messages that aren't suggestions posted in a guild.
+"""
+import asyncio
+import logging
+
+import main
+from benchmarks.load import MESSAGE_IDS, FakeMessage, FakeUser, SinkChannel, create_bot
+from benchmarks.replay import ReplayBot
+
+
+class Records(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(logging.DEBUG)
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def test_direct_messages_are_ignored(tmp_path):
+    async def run():
+        bot = create_bot(str(tmp_path), 'memory', cls=ReplayBot)
+        await bot._async_setup_hook()
+        author = FakeUser(10_001, "alice")
+        channel = SinkChannel(3000, None, 0.0)
+        message = FakeMessage(next(MESSAGE_IDS), "Title: Piranesi\nAuthor: Susanna Clarke", author, None, channel)
+        message._state = bot._connection
+        before = dict(main.MESSAGES.values)
+        await bot.on_message(message)
+        await bot.close()
+        return before, channel
+
+    records = Records()
+    main.logger.addHandler(records)
+    try:
+        before, channel = asyncio.run(run())
+    finally:
+        main.logger.removeHandler(records)
+
+    assert main.MESSAGES.values.get('error', 0) == before.get('error', 0)
+    assert [record for record in records.records if record.levelno >= logging.ERROR] == []
+    assert channel.messages == []
@@ -0,0 +1,107 @@
+"""
+The outbox coalesces identical channel sends, replies to every command, and only caps the concurrency of bulk sends.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from discord.ext import commands
+
+from benchmarks.load import SinkChannel
+from outbox import BULK, INTERACTIVE, SendScheduler
+
+
+class FakeContext(commands.Context):
+    """A command context whose replies go to a sink, like an interaction response would."""
+
+    def __init__(self, channel: SinkChannel) -> None:
+        self.message = SimpleNamespace(channel=channel)
+        self.replies = 0
+
+    async def send(self, content: str = None, **kwargs):
+        self.replies += 1
+        return await self.channel.send(content, **kwargs)
+
+
+def test_identical_sends_to_a_channel_are_coalesced():
+    async def run():
+        outbox = SendScheduler()
+        channel = SinkChannel(1, None, 0.01)
+        first, second = await asyncio.gather(outbox.send(channel, "hello"), outbox.send(channel, "hello"))
+        await outbox.close()
+        return channel, first, second, outbox
+
+    channel, first, second, outbox = asyncio.run(run())
+    assert first is second
+    assert channel.sent == 1 and outbox.coalesced == 1
+
+
+def test_every_context_gets_its_own_reply():
+    async def run():
+        outbox = SendScheduler()
+        channel = SinkChannel(1, None, 0.01)
+        contexts = [FakeContext(channel) for _ in range(3)]
+        await asyncio.gather(*(outbox.send(context, "Suggestion removed.") for context in contexts))
+        await outbox.close()
+        return channel, contexts
+
+    channel, contexts = asyncio.run(run())
+    assert [context.replies for context in contexts] == [1, 1, 1]
+    assert channel.sent == 3
+
+
+def test_interactive_sends_are_not_capped_across_channels():
+    # 100 channels with 50ms sends: capped at 4 sends at once this would take over a second
+    async def run():
+        outbox = SendScheduler(max_bulk=4)
+        channels = [SinkChannel(index, None, 0.05) for index in range(100)]
+        start = time.perf_counter()
+        await asyncio.gather(*(outbox.send(channel, f"reply {channel.id}") for channel in channels))
+        elapsed = time.perf_counter() - start
+        await outbox.close()
+        return elapsed
+
+    assert asyncio.run(run()) < 0.5
+
+
+class CountingChannel(SinkChannel):
+    running = peak = 0
+
+    async def send(self, content: str = None, **kwargs):
+        CountingChannel.running += 1
+        CountingChannel.peak = max(CountingChannel.peak, CountingChannel.running)
+        try:
+            return await super().send(content, **kwargs)
+        finally:
+            CountingChannel.running -= 1
+
+
+def test_bulk_sends_are_capped():
+    async def run():
+        outbox = SendScheduler(max_bulk=2)
+        users = [CountingChannel(index, None, 0.02) for index in range(10)]
+        await asyncio.gather(*(outbox.send(user, "page", priority=BULK) for user in users))
+        await outbox.close()
+
+    asyncio.run(run())
+    assert CountingChannel.peak == 2
+
+
+def test_interactive_sends_go_before_bulk_ones_of_the_same_bucket():
+    async def run():
+        outbox = SendScheduler()
+        user = SinkChannel(1, None, 0.02)
+        order = []
+
+        async def send(content: str, priority: int) -> None:
+            await outbox.send(user, content, priority=priority)
+            order.append(content)
+
+        # The first send keeps the worker busy while the others are queued
+        busy = asyncio.create_task(send("first", BULK))
+        await asyncio.sleep(0.005)
+        await asyncio.gather(busy, send("page", BULK), send("reply", INTERACTIVE))
+        await outbox.close()
+        return order
+
+    assert asyncio.run(run()) == ["first", "reply", "page"]
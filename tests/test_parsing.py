@@ -0,0 +1,39 @@
+"""
+The parsing service's bounded queue: a burst past it is shed instead of waiting without bound.
+"""
+import asyncio
+import time
+
+import parsing
+from parsing import ParseQueueFull, ParsingService
+
+
+def slow_parse(content: str) -> tuple[tuple | None, float]:
+    time.sleep(0.02)
+    return None, 0.02
+
+
+def burst(monkeypatch, shed: bool) -> list:
+    monkeypatch.setattr(parsing, 'parse_message', slow_parse)
+
+    async def run() -> list:
+        service = ParsingService(workers=1, max_pending=1, max_queued=2)
+        try:
+            return await asyncio.gather(*(service.parse(f"Title: book {number}", shed=shed) for number in range(5)),
+                                        return_exceptions=True)
+        finally:
+            service.close()
+
+    return asyncio.run(run())
+
+
+def test_burst_past_the_queue_is_shed(monkeypatch):
+    results = burst(monkeypatch, shed=True)
+    # One message parsed right away, two queued, the last two shed
+    assert results[:3] == [None, None, None]
+    assert all(isinstance(result, ParseQueueFull) for result in results[3:])
+
+
+def test_unshed_calls_wait(monkeypatch):
+    assert burst(monkeypatch, shed=False) == [None] * 5
+
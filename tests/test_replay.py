@@ -0,0 +1,117 @@
+"""
+Commands replayed offline run to completion, and only what can be replayed is recorded.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import discord
+from discord import app_commands
+
+from benchmarks.load import MESSAGE_IDS, FakeGuild, FakeMessage, FakeUser, SinkChannel, create_bot
+from benchmarks.replay import ReplayBot
+from recorder import EventRecorder
+
+
+async def grab_id(interaction: discord.Interaction, member: discord.Member) -> None:
+    pass
+
+
+def test_scan_edits_its_progress_message(tmp_path):
+    async def run():
+        bot = create_bot(str(tmp_path), 'memory', cls=ReplayBot)
+        await bot._async_setup_hook()
+        await bot.load_cogs()
+        guild = FakeGuild(1000, "Book club")
+        channel = guild.channel(2000, 0.0)
+        author = guild.members[10_001] = FakeUser(10_001, "alice")
+        message = FakeMessage(next(MESSAGE_IDS), ".scan 07/24", author, guild, channel)
+        message._state = bot._connection
+        await bot.on_message(message)
+        errors = dict(bot.command_errors)
+        await bot.close()
+        return errors, channel.messages
+
+    errors, sent = asyncio.run(run())
+    assert errors == {}
+    assert [content for content, _ in sent] == ["Scanning the last 1000 messages...",
+                                                "Added 0 suggestions to the database."]
+
+
+class HistoryChannel(SinkChannel):
+    """A channel whose history is `history`, newest first."""
+
+    def __init__(self, *args, history: list = ()) -> None:
+        super().__init__(*args)
+        self.past = list(history)
+
+    async def history(self, limit: int = None, **kwargs):
+        for message in self.past[:limit]:
+            yield message
+
+
+def test_scan_reports_messages_that_failed_to_parse(tmp_path):
+    async def run():
+        bot = create_bot(str(tmp_path), 'memory', cls=ReplayBot)
+        await bot._async_setup_hook()
+        await bot.load_cogs()
+        guild = FakeGuild(1000, "Book club")
+        author = guild.members[10_001] = FakeUser(10_001, "alice")
+        channel = guild.channels[2000] = HistoryChannel(2000, guild, 0.0)
+        channel.past = [FakeMessage(next(MESSAGE_IDS), content, author, guild, channel)
+                        for content in ("Title: Dune\nAuthor: Frank Herbert", "Title: broken", "Title: Emma")]
+        parse = bot.parsing.parse
+
+        async def failing_parse(content: str, shed: bool = True):
+            if content == "Title: broken":
+                raise RuntimeError("parser bug")
+            return await parse(content, shed)
+
+        bot.parsing.parse = failing_parse
+        message = FakeMessage(next(MESSAGE_IDS), ".scan 07/24", author, guild, channel)
+        message._state = bot._connection
+        await bot.on_message(message)
+        errors = dict(bot.command_errors)
+        await bot.close()
+        return errors, channel.messages
+
+    errors, sent = asyncio.run(run())
+    assert errors == {}
+    assert sent[-1][0] == "Added 2 suggestions to the database. 1 messages couldn't be parsed, they are in the logs."
+
+
+def test_context_menus_are_skipped(tmp_path):
+    path = tmp_path / 'traffic.log'
+    recorder = EventRecorder(str(path), '.')
+    user = SimpleNamespace(id=10_001, name="alice")
+    guild = SimpleNamespace(id=1000, name="Book club")
+
+    def interaction(command, options) -> SimpleNamespace:
+        return SimpleNamespace(type=discord.InteractionType.application_command, command=command,
+                               data={'options': options}, guild_id=guild.id, guild=guild, channel_id=2000, user=user)
+
+    suggestions = app_commands.Command(name='s', description="Suggestions", callback=grab_id)
+    recorder.record_interaction(interaction(suggestions, [{'value': '07/24'}]))
+    recorder.record_interaction(interaction(app_commands.ContextMenu(name="Grab ID", callback=grab_id), []))
+    recorder.close()
+
+    events = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [event['x'] for event in events] == ['s 07/24']
+    assert recorder.recorded == 1 and recorder.skipped == 1
+
+
+def test_anonymized_ids_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'traffic.log')
+    first = EventRecorder(path, '.', anonymize=True)
+    first.close()
+    second = EventRecorder(path, '.', anonymize=True)
+    second.close()
+    assert first._id(1000) == second._id(1000) != 1000
+
+    # A configured key is used as is, by every recorder given it
+    recorders = [EventRecorder(str(tmp_path / f"{name}.log"), '.', anonymize=True, key='00' * 16)
+                 for name in ('a', 'b')]
+    for recorder in recorders:
+        recorder.close()
+    assert recorders[0]._id(1000) == recorders[1]._id(1000) != first._id(1000)
+    assert not (tmp_path / 'a.log.key').exists()
@@ -0,0 +1,146 @@
+"""
+The cog and cache paths run the same way on both storage backends: suggestions posted, listed, removed and read back
+after a restart give the same replies and leave the same data behind.
+"""
+import asyncio
+import re
+import shutil
+
+import pytest
+
+import main
+from benchmarks.load import MESSAGE_IDS, FakeGuild, FakeMessage, FakeUser, create_bot
+from benchmarks.replay import ReplayBot
+from storage import TinyDBStorage, create_storage
+from utils import next_month_year
+
+UUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+class Session:
+    """A bot on the database of `directory`, with one guild, one channel and two members."""
+
+    def __init__(self, directory: str, backend: str) -> None:
+        self.bot = create_bot(directory, backend, cls=ReplayBot)
+        self.guild = FakeGuild(1000, "Book club")
+        self.channel = self.guild.channel(2000, 0.0)
+        self.alice = self.guild.members[10_001] = FakeUser(10_001, "alice")
+        self.bob = self.guild.members[10_002] = FakeUser(10_002, "bob")
+
+    async def start(self) -> 'Session':
+        await self.bot._async_setup_hook()
+        await self.bot.load_cogs()
+        return self
+
+    async def post(self, author: FakeUser, content: str, message_id: int = None) -> FakeMessage:
+        message = FakeMessage(message_id or next(MESSAGE_IDS), content, author, self.guild, self.channel)
+        message._state = self.bot._connection
+        await self.bot.on_message(message)
+        return message
+
+    async def suggestion_id(self, user: FakeUser, title: str) -> str:
+        server = await self.bot.database.get(self.guild.id)
+        suggestions = server['months'][next_month_year()][str(user.id)]
+        return next(suggestion['id'] for suggestion in suggestions if suggestion['title'] == title)
+
+    async def close(self) -> None:
+        await self.bot.close()
+
+
+def transcript(*sinks) -> list:
+    """What was sent to the sinks, with the random suggestion ids left out."""
+    sent = []
+    for sink in sinks:
+        for content, embeds in sink.messages:
+            sent.append((content, [UUID.sub('<id>', str(embed.to_dict())) for embed in embeds]))
+    return sent
+
+
+def stored(config: dict) -> dict:
+    """month -> user id -> titles, as found in the storage."""
+    storage = create_storage(config)
+    try:
+        return {month: {user: [suggestion['title'] for suggestion in suggestions]
+                        for user, suggestions in users.items()}
+                for server in storage.get_servers() for month, users in server['months'].items()}
+    finally:
+        storage.close()
+
+
+async def scenario(directory: str, backend: str) -> tuple[list, dict, dict]:
+    session = await Session(directory, backend).start()
+    first = await session.post(session.alice, "Title: Piranesi\nAuthor: Susanna Clarke")
+    await session.post(session.alice, "Title: Dune\nAuthor: Frank Herbert\n\nTitle: Emma\nAuthor: Jane Austen")
+    await session.post(session.bob, "hey, anyone read this yet?")
+    await session.post(session.bob, "**Title:** Beloved\n**Author:** Toni Morrison")
+    # The same message delivered twice is only ingested once
+    await session.post(session.alice, first.content, first.id)
+    await session.post(session.alice, ".s")
+    piranesi = await session.suggestion_id(session.alice, 'piranesi')
+    await session.post(session.bob, f".rs {piranesi}")
+    await session.post(session.alice, f".rs {piranesi}")
+    await session.post(session.alice, ".month")
+    errors = dict(session.bot.command_errors)
+    await session.close()
+    sent = transcript(session.channel, session.alice)
+
+    # Restarted on the same database
+    session = await Session(directory, backend).start()
+    await session.post(session.bob, ".s")
+    await session.post(session.alice, ".s")
+    await session.close()
+    return sent + transcript(session.channel), errors, stored(main.config)
+
+
+@pytest.mark.parametrize('backend', ['tinydb', 'sqlite'])
+def test_cog_behaviour(tmp_path, backend):
+    sent, errors, data = asyncio.run(scenario(str(tmp_path), backend))
+    month = next_month_year()
+
+    assert errors == {}
+    assert data == {month: {'10001': ['dune', 'emma'], '10002': ['beloved']}}
+    assert [(content, len(embeds)) for content, embeds in sent] == [
+        # The suggestions of each message, the duplicate isn't shown again
+        (None, 1), (None, 2), (None, 1),
+        (f"Suggestions 1-3 of 3 ({month})", 3),
+        ("Suggestion not found / Insufficient permissions.", 0),
+        ("Suggestion removed.", 0),
+        ("Suggestions sent to your DMs.", 0),
+        (f"Suggestions 1-3 of 3 ({month})", 3),
+        # After the restart
+        (f"Suggestions 1-1 of 1 ({month})", 1),
+        (f"Suggestions 1-2 of 2 ({month})", 2),
+    ]
+
+
+def test_backends_agree(tmp_path):
+    results = []
+    for backend in ('tinydb', 'sqlite'):
+        (tmp_path / backend).mkdir()
+        results.append(asyncio.run(scenario(str(tmp_path / backend), backend)))
+    assert results[0] == results[1]
+
+
+def test_sqlite_migrates_tinydb_once(tmp_path):
+    legacy = tmp_path / 'db.json'
+    shutil.copy('db.json', legacy)
+    source = TinyDBStorage(str(legacy))
+    expected = {server['server_id']: server for server in source.get_servers()}
+    source.close()
+    assert expected
+
+    config = {'storage': 'sqlite', 'database': str(tmp_path / 'db.sqlite3'), 'migrate_from': str(legacy)}
+    storage = create_storage(config)
+    migrated = {server['server_id']: server for server in storage.get_servers()}
+    assert {server_id: server['months'] for server_id, server in migrated.items()} == \
+           {server_id: server['months'] for server_id, server in expected.items()}
+
+    # Once the SQLite database has guilds, db.json is left alone
+    server_id = next(iter(migrated))
+    user_id, suggestions = next((user, suggestions) for users in migrated[server_id]['months'].values()
+                                for user, suggestions in users.items())
+    assert storage.remove_suggestion(server_id, user_id, suggestions[0]['id'])
+    storage.close()
+    storage = create_storage(config)
+    assert storage.get_server(server_id)['months'] != expected[server_id]['months']
+    storage.close()
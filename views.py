@@ -0,0 +1,84 @@
+import discord
+
+from utils import split_embed, EMBEDS_PER_MESSAGE, MESSAGE_EMBEDS_LIMIT
+
+PAGE_SIZE = 5
+
+
+class SuggestionPaginator(discord.ui.View):
+    """
+    Shows a month's suggestions, or the suggestions of one user in a month, a page at a time.
+
+    Only the cursor is kept: the offset of the page being shown and the offsets of the pages before it. Every button
+    press reads the next page from the guild cache and builds the embeds of that page only. A page has up to
+    `page_size` suggestions, fewer if their embeds don't fit in a single message.
+    """
+
+    def __init__(self, bot, guild: discord.Guild, month: str, user_id: str = None, owner_id: int = None,
+                 page_size: int = PAGE_SIZE, timeout: float = 300.0) -> None:
+        super().__init__(timeout=timeout)
+        self.bot = bot
+        self.guild = guild
+        self.month = month
+        self.user_id = user_id
+        self.owner_id = owner_id
+        self.page_size = page_size
+        self.offset = 0
+        self.previous_offsets: list[int] = []
+        self.shown = 0
+        self.total = 0
+        self.message: discord.Message | None = None
+
+    async def render(self) -> tuple[str, list[discord.Embed]]:
+        """Builds the current page. Returns the message content and the embeds."""
+        page, self.total = await self.bot.database.get_page(
+            self.guild.id, self.month, self.offset, self.page_size, self.user_id
+        )
+        names = await self.bot.user_names.resolve(self.guild, [user for user, _ in page])
+
+        embeds, size, self.shown = [], 0, 0
+        for user, suggestion in page:
+            parts = split_embed(self.bot.embeds.render(suggestion, names[user]))
+            part_size = sum(len(part) for part in parts)
+            if embeds and (len(embeds) + len(parts) > EMBEDS_PER_MESSAGE or size + part_size > MESSAGE_EMBEDS_LIMIT):
+                break
+            embeds.extend(parts)
+            size += part_size
+            self.shown += 1
+        # A single suggestion can be too long for a message, its middle parts are left out to keep the footer
+        while len(embeds) > EMBEDS_PER_MESSAGE or sum(len(embed) for embed in embeds) > MESSAGE_EMBEDS_LIMIT:
+            embeds.pop(-2)
+
+        self.previous.disabled = not self.previous_offsets
+        self.next.disabled = self.offset + self.shown >= self.total
+        content = f"Suggestions {self.offset + 1}-{self.offset + self.shown} of {self.total} ({self.month})"
+        return content, embeds
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if self.owner_id is not None and interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Only the member who used the command can turn pages.",
+                                                    ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        self.offset = self.previous_offsets.pop()
+        await self.show(interaction)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.primary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        self.previous_offsets.append(self.offset)
+        self.offset += self.shown
+        await self.show(interaction)
+
+    async def show(self, interaction: discord.Interaction) -> None:
+        content, embeds = await self.render()
+        await interaction.response.edit_message(content=content, embeds=embeds, view=self)
+
+    async def on_timeout(self) -> None:
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass